@@ -0,0 +1,113 @@
+import math
+from collections import deque
+import cv2
+
+
+def to_frame_location(location, scale, offset=(0, 0)):
+    """Map a (top, right, bottom, left) box from an image resized by `scale` back to frame pixels"""
+    top, right, bottom, left = location
+    dy, dx = offset
+    return (int(round(top / scale)) + dy, int(round(right / scale)) + dx,
+            int(round(bottom / scale)) + dy, int(round(left / scale)) + dx)
+
+
+class AdaptiveScaler:
+    """
+    Picks the detection scale for each frame from a latency budget and recent face sizes
+
+    face_locations costs roughly the same per pixel, so the measured cost
+    per detection pixel says how large a frame fits in budget_ms. Within
+    that limit the scale is only as large as needed to keep the smallest
+    recently seen face at min_face pixels: close, large faces are detected
+    on a small frame, and when nobody has been seen for a while the whole
+    budget is spent looking for small, distant faces.
+
+    Faces under refine_below pixels tall in the full-resolution frame are
+    re-detected on a crop of it, upscaled towards refine_face pixels, and
+    encoded from there, so the landmarks and encoding are not computed from
+    a handful of pixels. The refinement time is part of the cost passed to
+    observe(), so it counts against the budget like detection does.
+    """
+
+    def __init__(self, budget_ms=50.0, initial_scale=0.25, min_scale=0.1, max_scale=1.0,
+                 min_face=60, step=0.05, smoothing=0.2, face_memory=30,
+                 refine_below=80, refine_face=100, max_upscale=2.0, max_refine=4):
+        self.budget = budget_ms / 1000
+        self.scale = initial_scale
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.min_face = min_face
+        self.step = step
+        self.smoothing = smoothing
+        self.cost_per_pixel = None
+        # Smallest face height (frame pixels) per recent detection, None for frames without faces
+        self.recent_faces = deque(maxlen=face_memory)
+        self.refine_below = refine_below
+        self.refine_face = refine_face
+        self.max_upscale = max_upscale
+        self.max_refine = max_refine
+
+    def choose(self, height, width):
+        """Detection scale for a frame of the given size"""
+        if self.cost_per_pixel is None:
+            return self.scale
+
+        budget_scale = math.sqrt(self.budget / (self.cost_per_pixel * height * width))
+        faces = [h for h in self.recent_faces if h is not None]
+        wanted = self.min_face / min(faces) if faces else budget_scale
+        scale = min(wanted, budget_scale, self.max_scale)
+
+        # Round down to a step so small fluctuations do not change the resize every frame
+        scale = math.floor(scale / self.step) * self.step
+        self.scale = round(max(self.min_scale, scale), 4)
+        return self.scale
+
+    def observe(self, scale, seconds, image_shape, locations):
+        """Record the detection (plus refinement) time and face sizes for a frame detected at `scale`"""
+        pixels = image_shape[0] * image_shape[1]
+        if pixels:
+            cost = seconds / pixels
+            self.cost_per_pixel = cost if self.cost_per_pixel is None else \
+                (1 - self.smoothing) * self.cost_per_pixel + self.smoothing * cost
+        heights = [(bottom - top) / scale for top, right, bottom, left in locations]
+        self.recent_faces.append(min(heights) if heights else None)
+
+    def refine(self, frame, locations, scale):
+        """
+        Re-detect small faces on upscaled crops of the full-resolution BGR frame
+
+        Returns:
+            {index: (rgb_crop, crop_location, frame_location)} for the faces that were refined
+        """
+        import face_recognition
+
+        height, width = frame.shape[:2]
+        # Sizes in frame pixels: a face the detector saw small may still be large in the frame
+        small = sorted(((bottom - top) / scale, i) for i, (top, right, bottom, left) in enumerate(locations)
+                       if (bottom - top) / scale < self.refine_below)
+        refined = {}
+        for _, i in small[:self.max_refine]:
+            top, right, bottom, left = to_frame_location(locations[i], scale)
+            size = max(bottom - top, right - left, 1)
+            pad = size // 2
+            y0, y1 = max(0, top - pad), min(height, bottom + pad)
+            x0, x1 = max(0, left - pad), min(width, right + pad)
+            if y1 <= y0 or x1 <= x0:
+                continue
+
+            factor = min(self.refine_face / size, self.max_upscale)
+            if factor <= 1:
+                continue
+            crop = cv2.resize(frame[y0:y1, x0:x1], (0, 0), fx=factor, fy=factor,
+                              interpolation=cv2.INTER_LINEAR)
+            rgb_crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+            # The face is already close to refine_face pixels, so no extra upsampling is needed
+            found = face_recognition.face_locations(rgb_crop, number_of_times_to_upsample=0)
+            if not found:
+                continue
+
+            # Keep the detection closest to the centre of the crop, where the coarse face was
+            cy, cx = rgb_crop.shape[0] / 2, rgb_crop.shape[1] / 2
+            best = min(found, key=lambda l: ((l[0] + l[2]) / 2 - cy) ** 2 + ((l[1] + l[3]) / 2 - cx) ** 2)
+            refined[i] = (rgb_crop, best, to_frame_location(best, factor, (y0, x0)))
+        return refined
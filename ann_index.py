@@ -0,0 +1,310 @@
+import argparse
+import copy
+import hashlib
+import os
+import time
+import numpy as np
+
+
+def _sq_distances(a, b, b_sq_norms=None):
+    """Squared euclidean distances between the rows of a and b"""
+    if b_sq_norms is None:
+        b_sq_norms = np.einsum('ij,ij->i', b, b)
+    d = np.einsum('ij,ij->i', a, a)[:, None] + b_sq_norms[None, :] - 2.0 * a @ b.T
+    return np.maximum(d, 0, out=d)
+
+
+def _assign(x, centroids, chunk=8192):
+    """Index of the nearest centroid for every row of x, computed in chunks to bound memory"""
+    c_sq = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        labels[start:start + chunk] = _sq_distances(x[start:start + chunk], centroids, c_sq).argmin(axis=1)
+    return labels
+
+
+def kmeans(x, k, iterations=20, seed=0, max_samples=None):
+    """Plain Lloyd's k-means, optionally trained on a random subsample"""
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    k = max(1, min(k, len(x)))
+    if max_samples and len(x) > max_samples:
+        x = x[rng.choice(len(x), max_samples, replace=False)]
+
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters from random points so every list stays usable
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def fingerprint(vectors):
+    """Content hash used to check that a saved index matches the gallery it was built from"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return hashlib.sha1(vectors.tobytes()).hexdigest()
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over face embeddings
+
+    Vectors are clustered into n_lists coarse cells; a query only scans the
+    n_probe cells whose centroids are closest. n_probe is the recall/latency
+    knob: n_probe == n_lists is an exact search. With pq_subspaces > 0 the
+    residuals are also product-quantized to one byte per subspace and scanned
+    with lookup tables; the best candidates are then re-ranked exactly when the
+    full vectors are kept.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, pq_subspaces=0, keep_vectors=True,
+                 rerank=4, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.pq_subspaces = pq_subspaces
+        self.keep_vectors = keep_vectors or not pq_subspaces
+        self.rerank = rerank
+        self.seed = seed
+        self.fingerprint = None
+
+    def build(self, vectors, iterations=20):
+        """Train the coarse (and PQ) codebooks and fill the inverted lists"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n, dim = vectors.shape
+        self.dim = dim
+        self.size = n
+        self.fingerprint = fingerprint(vectors)
+        if not self.n_lists:
+            self.n_lists = int(max(1, min(n, 4 * np.sqrt(n))))
+
+        self.centroids = kmeans(vectors, self.n_lists, iterations, self.seed,
+                                max_samples=256 * self.n_lists)
+        self.n_lists = len(self.centroids)
+        labels = _assign(vectors, self.centroids)
+
+        # Inverted lists stored CSR-style: rows sorted by list, offsets per list
+        order = np.argsort(labels, kind='stable')
+        self.ids = order.astype(np.int64)
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=self.n_lists), out=self.offsets[1:])
+        sorted_vectors = vectors[order]
+        self.vectors = sorted_vectors if self.keep_vectors else None
+        self.sq_norms = np.einsum('ij,ij->i', sorted_vectors, sorted_vectors) if self.keep_vectors else None
+
+        self.codebooks = None
+        self.codes = None
+        if self.pq_subspaces:
+            if dim % self.pq_subspaces:
+                raise ValueError(f"pq_subspaces must divide the embedding size ({dim})")
+            sub = dim // self.pq_subspaces
+            residuals = sorted_vectors - self.centroids[labels[order]]
+            self.codebooks = np.zeros((self.pq_subspaces, 256, sub), dtype=np.float32)
+            self.codes = np.empty((n, self.pq_subspaces), dtype=np.uint8)
+            for j in range(self.pq_subspaces):
+                part = np.ascontiguousarray(residuals[:, j * sub:(j + 1) * sub])
+                book = kmeans(part, 256, iterations, self.seed + j + 1, max_samples=256 * 64)
+                self.codebooks[j, :len(book)] = book
+                self.codes[:, j] = _assign(part, book)
+        return self
+
+    def updated(self, mapping, vectors, ids, gallery_fingerprint=None):
+        """
+        A copy of the index after gallery rows were removed, renumbered or added, without re-clustering
+
+        mapping[old_id] is the row's new id (-1 if it was removed). The new
+        vectors go into the list of their nearest existing centroid and are
+        PQ-encoded with the existing codebooks, so the lists slowly drift
+        from the k-means optimum as the gallery changes; build() again after
+        large changes.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.asarray(ids, dtype=np.int64)
+        index = copy.copy(self)
+        remapped = np.asarray(mapping, dtype=np.int64)[self.ids]
+        kept = remapped >= 0
+        old_lists = np.repeat(np.arange(self.n_lists), np.diff(self.offsets))[kept]
+        new_lists = _assign(vectors, self.centroids) if len(vectors) else np.empty(0, dtype=np.int64)
+        lists = np.concatenate([old_lists, new_lists])
+        order = np.argsort(lists, kind='stable')
+
+        index.ids = np.concatenate([remapped[kept], ids])[order]
+        index.size = len(index.ids)
+        index.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=self.n_lists), out=index.offsets[1:])
+        if self.vectors is not None:
+            index.vectors = np.concatenate([self.vectors[kept], vectors])[order]
+            sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+            index.sq_norms = np.concatenate([self.sq_norms[kept], sq_norms])[order]
+        if self.codes is not None:
+            sub = self.dim // self.pq_subspaces
+            residuals = vectors - self.centroids[new_lists]
+            codes = np.empty((len(vectors), self.pq_subspaces), dtype=np.uint8)
+            for j in range(self.pq_subspaces):
+                part = np.ascontiguousarray(residuals[:, j * sub:(j + 1) * sub])
+                codes[:, j] = _assign(part, self.codebooks[j])
+            index.codes = np.concatenate([self.codes[kept], codes])[order]
+        index.fingerprint = gallery_fingerprint
+        return index
+
+    def _list_range(self, lists):
+        return np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+
+    def search(self, queries, k=1, n_probe=None):
+        """
+        Approximate k nearest neighbours
+
+        Returns:
+            (distances, ids): both of shape (queries, k); ids index the vectors
+            passed to build(), missing neighbours are -1 with infinite distance
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if self.size == 0:
+            return distances, ids
+
+        coarse = _sq_distances(queries, self.centroids)
+        probes = np.argpartition(coarse, n_probe - 1, axis=1)[:, :n_probe] if n_probe < self.n_lists \
+            else np.tile(np.arange(self.n_lists), (len(queries), 1))
+
+        for qi, query in enumerate(queries):
+            rows = self._list_range(probes[qi])
+            if not len(rows):
+                continue
+            if self.codes is None:
+                d = _sq_distances(query[None], self.vectors[rows], self.sq_norms[rows])[0]
+            else:
+                d = self._adc_distances(query, probes[qi])
+                if self.vectors is not None:
+                    # Re-rank the best PQ candidates with exact distances
+                    shortlist = min(len(rows), k * self.rerank)
+                    keep = np.argpartition(d, shortlist - 1)[:shortlist]
+                    rows = rows[keep]
+                    d = _sq_distances(query[None], self.vectors[rows], self.sq_norms[rows])[0]
+
+            top = min(k, len(rows))
+            best = np.argpartition(d, top - 1)[:top]
+            best = best[np.argsort(d[best])]
+            distances[qi, :top] = np.sqrt(d[best])
+            ids[qi, :top] = self.ids[rows[best]]
+        return distances, ids
+
+    def _adc_distances(self, query, lists):
+        """Asymmetric PQ distances from a query to every vector in the given lists"""
+        sub = self.dim // self.pq_subspaces
+        residuals = (query[None] - self.centroids[lists]).reshape(len(lists), self.pq_subspaces, 1, sub)
+        tables = ((self.codebooks[None] - residuals) ** 2).sum(axis=3)
+        subspaces = np.arange(self.pq_subspaces)
+        parts = [tables[i][subspaces, self.codes[self.offsets[l]:self.offsets[l + 1]]].sum(axis=1)
+                 for i, l in enumerate(lists)]
+        return np.concatenate(parts)
+
+    def save(self, path):
+        """Persist the index so it can be reloaded without re-clustering"""
+        arrays = {
+            'params': np.array([self.dim, self.size, self.n_lists, self.n_probe,
+                                self.pq_subspaces, self.rerank, self.seed], dtype=np.int64),
+            'fingerprint': np.array(self.fingerprint),
+            'centroids': self.centroids,
+            'ids': self.ids,
+            'offsets': self.offsets,
+        }
+        if self.vectors is not None:
+            arrays['vectors'] = self.vectors
+        if self.codes is not None:
+            arrays['codebooks'] = self.codebooks
+            arrays['codes'] = self.codes
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            dim, size, n_lists, n_probe, pq_subspaces, rerank, seed = (int(v) for v in data['params'])
+            index = cls(n_lists, n_probe, pq_subspaces, keep_vectors='vectors' in data,
+                        rerank=rerank, seed=seed)
+            index.dim, index.size = dim, size
+            index.fingerprint = str(data['fingerprint'])
+            index.centroids = data['centroids']
+            index.ids = data['ids']
+            index.offsets = data['offsets']
+            index.vectors = data['vectors'] if 'vectors' in data else None
+            index.sq_norms = (np.einsum('ij,ij->i', index.vectors, index.vectors)
+                              if index.vectors is not None else None)
+            index.codebooks = data['codebooks'] if 'codebooks' in data else None
+            index.codes = data['codes'] if 'codes' in data else None
+        return index
+
+
+def exact_search(vectors, queries, k=1):
+    """Brute-force reference search used to measure recall"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    d = _sq_distances(queries, vectors)
+    top = np.argsort(d, axis=1)[:, :k]
+    return np.sqrt(np.take_along_axis(d, top, axis=1)), top
+
+
+def measure_recall(index, vectors, queries, k=1, n_probe=None):
+    """
+    Recall@k of the index against exact search, and the mean query latency
+
+    Returns:
+        (recall, ms_per_query)
+    """
+    _, truth = exact_search(vectors, queries, k)
+    start = time.perf_counter()
+    _, found = index.search(queries, k, n_probe)
+    elapsed = time.perf_counter() - start
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size, 1000 * elapsed / len(queries)
+
+
+def synthetic_gallery(n, identities=None, dim=128, noise=0.05, seed=0):
+    """Random embeddings clustered around per-identity centres, like several photos per person"""
+    rng = np.random.default_rng(seed)
+    identities = identities or max(1, n // 3)
+    centres = rng.normal(0, 0.1, (identities, dim)).astype(np.float32)
+    labels = rng.integers(0, identities, n)
+    return centres[labels] + rng.normal(0, noise, (n, dim)).astype(np.float32), labels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure IVF index recall and latency against exact search")
+    parser.add_argument('--size', type=int, default=100000, help="number of gallery embeddings")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--lists', type=int, default=None, help="coarse cells (default 4*sqrt(size))")
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--pq', type=int, default=0, help="PQ subspaces (0 disables product quantization)")
+    parser.add_argument('--save', help="write the built index to this file")
+    args = parser.parse_args()
+
+    vectors, labels = synthetic_gallery(args.size)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), args.queries)
+    queries = vectors[picks] + rng.normal(0, 0.05, (args.queries, vectors.shape[1])).astype(np.float32)
+
+    start = time.perf_counter()
+    index = IVFIndex(args.lists, pq_subspaces=args.pq).build(vectors)
+    print(f"Built index over {args.size} embeddings ({index.n_lists} lists) in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    exact_search(vectors, queries)
+    print(f"Exact search: {1000 * (time.perf_counter() - start) / args.queries:.3f} ms/query")
+
+    for n_probe in args.probes:
+        recall, ms = measure_recall(index, vectors, queries, 1, n_probe)
+        print(f"n_probe={n_probe:4d}  recall@1={recall:.3f}  {ms:.3f} ms/query")
+
+    if args.save:
+        index.save(args.save)
+        print(f"Saved index to {args.save}")
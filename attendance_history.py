@@ -0,0 +1,176 @@
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    time TEXT NOT NULL,
+    PRIMARY KEY (date, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attendance_by_name ON attendance (name, date);
+"""
+
+DATE_TIME = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+
+
+def default_history_path(csv_path):
+    """attendance.csv -> attendance.db"""
+    return os.path.splitext(csv_path)[0] + '.db'
+
+
+class AttendanceHistory:
+    """
+    Indexed attendance history in SQLite
+
+    Rows are clustered by (date, name), so a day or a date range is a
+    contiguous slice of the primary key, and a second index on (name, date)
+    serves per-person queries. The key also enforces one mark per person per
+    day. Reports read only the rows they need instead of the whole CSV.
+    """
+
+    def __init__(self, path='attendance.db'):
+        self.path = path
+        self.created = not os.path.exists(path)
+        self.lock = threading.Lock()
+        # Written from the attendance writer thread, queried from the main thread
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def add(self, rows):
+        """Insert (name, date, time) rows, ignoring people already marked that day; returns rows added"""
+        with self.lock, self.db:
+            before = self.db.total_changes
+            self.db.executemany('INSERT OR IGNORE INTO attendance (name, date, time) VALUES (?, ?, ?)', rows)
+            return self.db.total_changes - before
+
+    def import_csv(self, csv_path, batch_size=50000):
+        """
+        Load an attendance CSV (Name,Date,Time) into the history
+
+        Safe to run repeatedly: rows that are already present are skipped.
+
+        Returns:
+            (rows_read, rows_added, rows_skipped_as_invalid)
+        """
+        read = added = invalid = 0
+        batch = []
+        with open(csv_path, newline='') as f:
+            for row in csv.DictReader(f):
+                read += 1
+                name, date, time_string = row.get('Name'), row.get('Date'), row.get('Time')
+                if not name or not DATE_TIME.fullmatch(f"{date} {time_string}"):
+                    invalid += 1
+                    continue
+                batch.append((name, date, time_string))
+                if len(batch) >= batch_size:
+                    added += self.add(batch)
+                    batch = []
+        if batch:
+            added += self.add(batch)
+        return read, added, invalid
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def names_on(self, date):
+        """Names marked on a date (YYYY-MM-DD)"""
+        return {row[0] for row in self._query('SELECT name FROM attendance WHERE date = ?', (date,))}
+
+    def day(self, date):
+        """[(name, time)] for one day, in order of arrival"""
+        return self._query('SELECT name, time FROM attendance WHERE date = ? ORDER BY time', (date,))
+
+    def person(self, name, start='0000-00-00', end='9999-99-99'):
+        """[(date, time)] for one person between two dates (inclusive)"""
+        return self._query('SELECT date, time FROM attendance WHERE name = ? AND date BETWEEN ? AND ? '
+                           'ORDER BY date', (name, start, end))
+
+    def summary(self, start, end):
+        """[(name, days_present, first_date, last_date)] for everyone seen between two dates"""
+        return self._query('SELECT name, COUNT(*), MIN(date), MAX(date) FROM attendance '
+                           'WHERE date BETWEEN ? AND ? GROUP BY name ORDER BY name', (start, end))
+
+    def daily_counts(self, start, end):
+        """[(date, people_present)] for every day with attendance between two dates"""
+        return self._query('SELECT date, COUNT(*) FROM attendance WHERE date BETWEEN ? AND ? '
+                           'GROUP BY date ORDER BY date', (start, end))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def _date(value):
+    """argparse type: YYYY-MM-DD"""
+    datetime.strptime(value, '%Y-%m-%d')
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attendance history reports")
+    parser.add_argument('--db', default='attendance.db', help="history database (default: attendance.db)")
+    sub = parser.add_subparsers(dest='command')
+
+    imp = sub.add_parser('import', help="load an attendance CSV into the history")
+    imp.add_argument('csv', nargs='?', default='attendance.csv')
+
+    day = sub.add_parser('day', help="who was present on a day")
+    day.add_argument('date', nargs='?', type=_date, default=datetime.now().strftime('%Y-%m-%d'))
+
+    person = sub.add_parser('person', help="every day a person was present")
+    person.add_argument('name')
+    person.add_argument('--from', dest='start', type=_date, default=None)
+    person.add_argument('--to', dest='end', type=_date, default=None)
+
+    rng = sub.add_parser('range', help="days present per person, and people present per day, between two dates")
+    rng.add_argument('start', type=_date)
+    rng.add_argument('end', type=_date)
+    rng.add_argument('--daily', action='store_true', help="also list the number of people present each day")
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        sys.exit(0)
+    if args.command != 'import' and not os.path.exists(args.db):
+        print(f"No attendance history at {args.db}; run 'python attendance_history.py import' first")
+        sys.exit(1)
+
+    history = AttendanceHistory(args.db)
+    start = time.perf_counter()
+    if args.command == 'import':
+        read, added, invalid = history.import_csv(args.csv)
+        print(f"Imported {added} of {read} rows from {args.csv} into {args.db} "
+              f"({read - added - invalid} already present, {invalid} invalid)")
+    elif args.command == 'day':
+        rows = history.day(args.date)
+        for name, time_string in rows:
+            print(f"{time_string}  {name}")
+        print(f"\n{len(rows)} present on {args.date}")
+    elif args.command == 'person':
+        rows = history.person(args.name, args.start or '0000-00-00', args.end or '9999-99-99')
+        for date, time_string in rows:
+            print(f"{date}  {time_string}")
+        print(f"\n{args.name}: present on {len(rows)} days")
+    elif args.command == 'range':
+        rows = history.summary(args.start, args.end)
+        print(f"{'Name':30s} {'Days':>6s}  First       Last")
+        for name, days, first, last in rows:
+            print(f"{name:30s} {days:6d}  {first}  {last}")
+        if args.daily:
+            print()
+            for date, count in history.daily_counts(args.start, args.end):
+                print(f"{date}  {count}")
+        print(f"\n{len(rows)} people present between {args.start} and {args.end}")
+    print(f"({1000 * (time.perf_counter() - start):.1f} ms)", file=sys.stderr)
+    history.close()
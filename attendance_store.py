@@ -0,0 +1,145 @@
+import atexit
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from attendance_history import AttendanceHistory, default_history_path
+
+FIELDS = ['Name', 'Date', 'Time']
+
+
+class AttendanceStore:
+    """
+    Append-only attendance.csv writer with an in-memory duplicate check
+
+    The (name, date) pairs already marked today are read once at startup, so
+    a repeat recognition is a set lookup instead of a full CSV scan. New rows
+    are queued to a background thread that appends them in batches and
+    fsyncs once per batch. The file keeps the Name,Date,Time CSV format.
+
+    Every batch is also written to the indexed history database next to the
+    CSV (see attendance_history.py), which today's marks are read from and
+    which the reports query. A missing database is built from the CSV once.
+    """
+
+    def __init__(self, path='attendance.csv', flush_interval=1.0, batch_size=64, history_path=None):
+        self.path = path
+        self.history = AttendanceHistory(history_path or default_history_path(path))
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.marked = set()
+        self.seeded = set()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.closed = False
+
+        self._prepare_file()
+        self._seed(datetime.now().strftime('%Y-%m-%d'))
+
+        self.writer = threading.Thread(target=self._write_loop, name='attendance-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def _prepare_file(self):
+        """Create the file with a header, or make sure an existing one ends with a newline"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'w', newline='') as f:
+                csv.writer(f, lineterminator='\n').writerow(FIELDS)
+            print(f"Created {self.path}")
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) not in (b'\n', b'\r'):
+                f.write(b'\n')
+
+    def _seed(self, date_string):
+        """Load today's marks from the history, importing the existing CSV if the history is new"""
+        if self.history.created:
+            read, added, invalid = self.history.import_csv(self.path)
+            if read:
+                print(f"Imported {added} attendance records from {self.path} into {self.history.path}")
+        self.marked.update((name, date_string) for name in self.history.names_on(date_string))
+        self.seeded.add(date_string)
+
+    def marked_on(self, date_string):
+        """Names marked on a given date (YYYY-MM-DD) during this run or earlier today"""
+        with self.lock:
+            return {name for name, date in self.marked if date == date_string}
+
+    def mark(self, name, when=None):
+        """
+        Record attendance unless the person is already marked for that day
+
+        Only today's marks are loaded at startup; the first mark on any other
+        day (a `when` in the past, or after midnight) loads that day's marks
+        from the history first.
+
+        Returns:
+            The time string written, or None if this was a repeat
+        """
+        when = when or datetime.now()
+        date_string = when.strftime('%Y-%m-%d')
+        key = (name, date_string)
+        with self.lock:
+            if date_string not in self.seeded:
+                self.marked.update((marked, date_string) for marked in self.history.names_on(date_string))
+                self.seeded.add(date_string)
+            if key in self.marked:
+                return None
+            self.marked.add(key)
+
+        time_string = when.strftime('%H:%M:%S')
+        self.queue.put((name, date_string, time_string))
+        return time_string
+
+    def _write_loop(self):
+        stop = False
+        while not stop:
+            batch = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._append(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+
+    def _append(self, rows):
+        try:
+            with open(self.path, 'a', newline='') as f:
+                csv.writer(f, lineterminator='\n').writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"Error writing attendance to {self.path}: {str(e)}")
+        try:
+            self.history.add(rows)
+        except sqlite3.Error as e:
+            print(f"Error writing attendance to {self.history.path}: {str(e)}")
+
+    def flush(self):
+        """Block until every queued mark has been written and synced"""
+        self.queue.join()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+        self.history.close()
@@ -1,77 +1,342 @@
+import time
+
+# Measured from the first import so time-to-first-frame includes loading the libraries
+STARTED = time.perf_counter()
+
 import cv2
-import numpy as np
-import face_recognition
 import os
 from datetime import datetime
-import pandas as pd
-import time
+import argparse
+import contextlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from gallery_cache import GalleryCache
+from attendance_store import AttendanceStore
+from recognition_pipeline import RecognitionPipeline
+from face_tracker import FaceTracker
+from metrics import Metrics
+from overlay import OverlayRenderer
+from face_matcher import FaceMatcher
+from gallery_condense import Prototypes, inconsistent_photos
+from ann_index import IVFIndex, fingerprint
+from adaptive_scale import AdaptiveScaler, to_frame_location
+from motion_gate import MotionGate
+from face_detectors import create_detector
+from evidence_recorder import EvidenceRecorder
+
+# face_recognition is imported inside the functions that use it: importing it
+# loads dlib and its models, which takes seconds and is not needed to open the
+# camera or show the first frame.
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+WINDOW_NAME = 'Face Recognition Attendance System'
+
+
+def face_name_from_filename(filename):
+    """Extract the person's name from a photo filename ("john_1.jpg" -> "john")"""
+    name = os.path.splitext(filename)[0]
+    if '_' in name and name.split('_')[-1].isdigit():
+        name = '_'.join(name.split('_')[:-1])
+    return name
+
+
+def scan_face_images(images_dir):
+    """
+    List the photos in the images directory along with the per-user directories
+
+    Flat files (john.jpg, john_1.jpg) come first, followed by the photos in
+    each per-user directory (known_faces/john/photo_1.jpg), each in sorted
+    order so the gallery is built deterministically.
+
+    Returns:
+        (images, user_dirs): (image_path, name) pairs, and the name of every
+        user directory, including ones without photos
+    """
+    # One scandir pass: the directory entries already say which are files and folders
+    with os.scandir(images_dir) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+
+    images = [(entry.path, face_name_from_filename(entry.name)) for entry in entries
+              if entry.name.endswith(IMAGE_EXTENSIONS) and entry.is_file()]
+
+    user_dirs = []
+    for entry in entries:
+        if entry.is_dir():
+            user_dirs.append(entry.name)
+            with os.scandir(entry.path) as it:
+                images.extend((photo.path, entry.name) for photo in sorted(it, key=lambda p: p.name)
+                              if photo.name.endswith(IMAGE_EXTENSIONS))
+
+    return images, user_dirs
+
+
+def list_face_images(images_dir):
+    """List (image_path, name) pairs for every photo in the images directory (see scan_face_images)"""
+    return scan_face_images(images_dir)[0]
+
+
+def stat_images(images):
+    """{image_path: (name, size, mtime_ns)} for the listed photos that still exist"""
+    snapshot = {}
+    for path, name in images:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        snapshot[path] = (name, stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+def encode_face_image(image_path):
+    """Return the encoding of the first face in an image, or None if no face is found"""
+    import face_recognition
+    image = face_recognition.load_image_file(image_path)
+    face_locations = face_recognition.face_locations(image)
+    if not face_locations:
+        return None
+    return face_recognition.face_encodings(image, face_locations)[0]
+
+
+def _no_timer(stage):
+    return contextlib.nullcontext()
+
+
+def identify_faces(rgb_image, matcher, scale=1, metrics=None, scaler=None, frame=None, detector=None):
+    """
+    Detect, encode and match every face in an RGB image without side effects
+
+    rgb_image is the frame resized by `scale`. With an AdaptiveScaler, the
+    detection time is fed back to it and small faces are refined on crops
+    of the full-resolution BGR `frame`. `detector` is a backend from
+    face_detectors.py (HOG when None).
+
+    Returns:
+        List of (face_location, Match) with locations in full-frame coordinates
+    """
+    import face_recognition
+
+    timer = metrics.time if metrics else _no_timer
+
+    # Find faces in the frame
+    with timer('face_locations'):
+        start = time.perf_counter()
+        face_locations = detector.detect(rgb_image) if detector else face_recognition.face_locations(rgb_image)
+    frame_locations = [to_frame_location(location, scale) for location in face_locations]
+
+    refined = {}
+    if scaler is not None and frame is not None and face_locations:
+        with timer('refine'):
+            refined = scaler.refine(frame, face_locations, scale)
+    if scaler is not None:
+        # Refinement passes count against the detection budget too
+        scaler.observe(scale, time.perf_counter() - start, rgb_image.shape, face_locations)
+
+    with timer('face_encodings'):
+        coarse = [i for i in range(len(face_locations)) if i not in refined]
+        face_encodings = [None] * len(face_locations)
+        if coarse:
+            encoded = face_recognition.face_encodings(rgb_image, [face_locations[i] for i in coarse])
+            for i, encoding in zip(coarse, encoded):
+                face_encodings[i] = encoding
+        for i, (rgb_crop, crop_location, frame_location) in refined.items():
+            face_encodings[i] = face_recognition.face_encodings(rgb_crop, [crop_location])[0]
+            frame_locations[i] = frame_location
+
+    # Match all faces against the gallery in one batch
+    with timer('match'):
+        matches = matcher.match(face_encodings)
+    return list(zip(frame_locations, matches))
+
+
+def _encode_worker(image_path):
+    """Process pool entry point: never raises, so one bad photo cannot break the batch"""
+    try:
+        return image_path, encode_face_image(image_path), None
+    except Exception as e:
+        return image_path, None, str(e)
+
 
 class AttendanceSystem:
-    def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.attendance_file = 'attendance.csv'
-        self.images_dir = 'known_faces'
-        self.today_attendance = set()
+    def __init__(self, use_cache=True, workers=1, tolerance=0.6, ann_probe=None,
+                 detect_interval=1, detect_scale=None, detect_budget_ms=50.0,
+                 motion_threshold=0.01, motion_delta=25, force_detect=2.0, detector='auto',
+                 images_dir='known_faces', attendance_file='attendance.csv', background_load=False,
+                 quantize=False, condense=True):
+        """
+        With background_load the gallery is loaded on a separate thread, so the
+        camera can open while photos are still being read and encoded. Until
+        gallery_ready is set, recognize() returns no faces and the dashboard
+        shows the loading progress.
+
+        The encodings and names live only in the matcher (float32, or int8
+        with quantize); known_face_paths lists the photo of each matcher row.
+        With condense, faces are matched against a few prototypes per person
+        first (see gallery_condense.py).
+        """
+        self.known_face_paths = []
+        # Photos (with their size and mtime) the gallery was loaded from; the watcher starts from it
+        self.gallery_snapshot = None
+        self.quantize = quantize
+        self.condense = condense
+        self.ann_probe = ann_probe
+        self.attendance_file = attendance_file
+        self.images_dir = images_dir
+        self.use_cache = use_cache
+        self.workers = workers or os.cpu_count() or 1
         self.frame_count = 0
         self.fps = 0
+        self.latency_ms = None
         self.last_time = datetime.now()
+        self.first_frame_shown = False
+        self.gallery_ready = threading.Event()
+        self.load_progress = (0, 0)
+
+        # Track faces between detections when detection is not run on every frame
+        self.tracker = FaceTracker(detect_interval) if detect_interval > 1 else None
+        self.tracker_lock = threading.Lock()
+
+        # Detection resolution: a fixed fraction of the frame, or chosen per frame from a
+        # latency budget. Tracked boxes must stay in one coordinate system, so tracking
+        # always uses a fixed scale.
+        if detect_scale is None and self.tracker is not None:
+            detect_scale = 0.25
+        self.detect_scale = detect_scale
+        self.scaler = AdaptiveScaler(detect_budget_ms) if detect_scale is None else None
+
+        # Face detector backend (see face_detectors.py); 'auto' uses the calibrated choice
+        self.detector = create_detector(detector)
+
+        # Skip detection on frames where nothing moved and reuse the last results
+        self.motion_gate = MotionGate(motion_threshold, motion_delta, force_detect) if motion_threshold else None
+        self.last_results = []
+
+        # Called with (name, time_string) whenever a new attendance mark is recorded
+        self.mark_callbacks = []
+
+        # Saves the frames leading up to marks and unknown faces (see enable_evidence)
+        self.evidence = None
+
+        # Per-stage latency histograms and counters (see metrics.py)
+        self.metrics = Metrics()
+
+        # Draws the dashboard and face labels in place (see overlay.py)
+        self.overlay = OverlayRenderer()
         
         # Create directory for known faces if it doesn't exist
         if not os.path.exists(self.images_dir):
             os.makedirs(self.images_dir)
             print(f"Created {self.images_dir} directory")
             
-        # Create attendance file if it doesn't exist
-        if not os.path.exists(self.attendance_file):
-            df = pd.DataFrame(columns=['Name', 'Date', 'Time'])
-            df.to_csv(self.attendance_file, index=False)
-            print(f"Created {self.attendance_file}")
-        
-        self.load_known_faces()
+        # Open the attendance file (created if it doesn't exist) and load today's marks
+        self.attendance_store = AttendanceStore(self.attendance_file)
+        self.today_attendance = self.attendance_store.marked_on(datetime.now().strftime('%Y-%m-%d'))
+
+        self.matcher = FaceMatcher([], [], tolerance=tolerance)
+        if background_load:
+            threading.Thread(target=self._load_gallery, args=(tolerance, ann_probe),
+                             name='gallery-loader', daemon=True).start()
+        else:
+            self._load_gallery(tolerance, ann_probe)
+
+    def _load_gallery(self, tolerance, ann_probe):
+        """Load the known faces, build the matcher and swap it in, then set gallery_ready"""
+        start = time.perf_counter()
+        try:
+            encodings, names, paths = self.load_known_faces()
+            matcher = FaceMatcher(encodings, names, tolerance=tolerance, quantize=self.quantize)
+            del encodings, names
+            self.known_face_paths = [paths[i] for i in matcher.order]
+            # recognize() does not read the matcher until gallery_ready is set
+            self.matcher = matcher
+            if ann_probe:
+                self.load_ann_index(ann_probe)
+            elif self.condense:
+                self.condense_gallery()
+        except Exception as e:
+            print(f"Error loading known faces: {str(e)}")
+        finally:
+            self.gallery_ready.set()
+        self.metrics.gauge('gallery_encodings', len(self.matcher))
+        self.metrics.gauge('gallery_people', len(self.matcher.identities))
+        self.metrics.gauge('gallery_bytes', self.matcher.nbytes)
+        self.metrics.gauge('gallery_load_seconds', round(time.perf_counter() - start, 3))
 
     def load_known_faces(self):
-        """Load known faces from the images directory"""
+        """
+        Load known faces from the images directory, reusing cached encodings where possible
+
+        Returns:
+            (encodings, names, paths) for every photo with a face
+        """
         print("\nLoading known faces...")
         loaded = 0
-        
-        # First, check for files directly in the known_faces directory
-        for filename in os.listdir(self.images_dir):
-            file_path = os.path.join(self.images_dir, filename)
-            if os.path.isfile(file_path) and filename.endswith((".jpg", ".jpeg", ".png")):
-                try:
-                    # Extract name from filename
-                    name = os.path.splitext(filename)[0]
-                    if '_' in name and name.split('_')[-1].isdigit():
-                        # For files like "john_1.jpg", extract just "john"
-                        name = '_'.join(name.split('_')[:-1])
-                    
-                    self._process_face_image(file_path, name)
-                    loaded += 1
-                except Exception as e:
-                    print(f"Error loading {filename}: {str(e)}")
-        
-        # Then, check for user directories and their photos
-        for dirname in os.listdir(self.images_dir):
-            dir_path = os.path.join(self.images_dir, dirname)
-            if os.path.isdir(dir_path):
-                print(f"Loading photos for {dirname}...")
-                user_loaded = 0
-                
-                # Process all photos in this user's directory
-                for filename in os.listdir(dir_path):
-                    if filename.endswith((".jpg", ".jpeg", ".png")):
-                        try:
-                            image_path = os.path.join(dir_path, filename)
-                            self._process_face_image(image_path, dirname)
-                            user_loaded += 1
-                            loaded += 1
-                        except Exception as e:
-                            print(f"Error loading {dirname}/{filename}: {str(e)}")
-                
-                print(f"Loaded {user_loaded} photos for {dirname}")
-        
-        unique_people = len(set(self.known_face_names))
+        cached = 0
+        user_counts = {}
+        known_encodings, known_names, known_paths = [], [], []
+
+        cache = GalleryCache(self.images_dir).load() if self.use_cache else None
+        images = list_face_images(self.images_dir)
+        # Stat before reading, so any later change shows up as a change to the watcher
+        self.gallery_snapshot = stat_images(images)
+        self.load_progress = (0, len(images))
+
+        # Resolve cache hits first; only the misses are sent to the encoder
+        encodings = [None] * len(images)
+        pending = []
+        for i, (image_path, name) in enumerate(images):
+            try:
+                hit = cache.lookup(image_path, name) if cache else None
+            except OSError as e:
+                print(f"Error loading {image_path}: {str(e)}")
+                continue
+            if hit is None:
+                pending.append(i)
+                continue
+            has_face, encoding = hit
+            cached += 1
+            if has_face:
+                encodings[i] = encoding
+        self.load_progress = (len(images) - len(pending), len(images))
+
+        pending_paths = [images[i][0] for i in pending]
+        for (image_path, encoding, error), i in zip(self._encode_images(pending_paths), pending):
+            self.load_progress = (self.load_progress[0] + 1, len(images))
+            name = images[i][1]
+            if error:
+                print(f"Error loading {image_path}: {error}")
+                continue
+            if cache:
+                cache.put(image_path, name, encoding)
+            if encoding is None:
+                print(f"No face found in {image_path}")
+                continue
+            encodings[i] = encoding
+            print(f"Loaded: {name} from {os.path.basename(image_path)}")
+
+        for (image_path, name), encoding in zip(images, encodings):
+            if encoding is None:
+                continue
+            known_encodings.append(encoding)
+            known_names.append(name)
+            known_paths.append(image_path)
+            loaded += 1
+            if os.path.dirname(os.path.normpath(image_path)) != os.path.normpath(self.images_dir):
+                user_counts[name] = user_counts.get(name, 0) + 1
+
+        for dirname, user_loaded in user_counts.items():
+            print(f"Loaded {user_loaded} photos for {dirname}")
+
+        if cache:
+            removed = cache.prune([path for path, _ in images])
+            if removed:
+                print(f"Dropped {removed} deleted photos from the gallery cache")
+            if cache.dirty:
+                cache.save()
+            print(f"Reused {cached} cached encodings, encoded {len(pending)} new or changed photos")
+
+        unique_people = len(set(known_names))
         print(f"\nTotal faces loaded: {loaded}")
         print(f"Total unique people: {unique_people}")
         
@@ -79,46 +344,118 @@ class AttendanceSystem:
             print("No faces found in known_faces directory!")
             print("Please add some .jpg photos named after the person (e.g., john.jpg)")
             print("Or use the take_multiple_photos.py script to add photos")
-    
-    def _process_face_image(self, image_path, name):
-        """Process a single face image and add it to the known faces"""
-        try:
-            image = face_recognition.load_image_file(image_path)
-            face_locations = face_recognition.face_locations(image)
-            
-            if not face_locations:
-                print(f"No face found in {image_path}")
-                return False
-            
-            encoding = face_recognition.face_encodings(image, face_locations)[0]
-            self.known_face_encodings.append(encoding)
-            self.known_face_names.append(name)
-            print(f"Loaded: {name} from {os.path.basename(image_path)}")
-            return True
-        except Exception as e:
-            print(f"Error processing {image_path}: {str(e)}")
-            return False
+        return known_encodings, known_names, known_paths
+
+    def enable_evidence(self, **options):
+        """Start an EvidenceRecorder that saves the last seconds of frames on every mark and unknown face"""
+        self.evidence = EvidenceRecorder(metrics=self.metrics, **options)
+        self.mark_callbacks.append(lambda name, time_string: self.evidence.trigger('marked', name))
+        return self.evidence
+
+    def condense_gallery(self):
+        """Build per-person prototypes for the matcher and report enrollment photos that do not fit"""
+        prototypes = Prototypes.build(self.matcher)
+        self.matcher.use_prototypes(prototypes)
+        self.metrics.gauge('gallery_prototypes', len(prototypes))
+        print(f"Condensed {len(self.matcher)} encodings to {len(prototypes)} prototypes")
+
+        for row, distance, other, other_distance in inconsistent_photos(self.matcher, prototypes):
+            name = self.matcher.identities[self.matcher.labels[row]]
+            closer = f", closer to {other}" if other_distance < distance else ""
+            print(f"Inconsistent photo for {name}: {self.known_face_paths[row]} "
+                  f"(distance {distance:.2f} from the average of their photos{closer})")
+
+    def _encode_images(self, image_paths):
+        """
+        Encode photos, yielding (image_path, encoding, error) in input order
+
+        With more than one worker the photos are spread over a process pool;
+        results are streamed back in order as they complete. A failure in one
+        photo is reported in its error field and does not affect the others.
+        """
+        if not image_paths:
+            return
+
+        workers = min(self.workers, len(image_paths))
+        start = time.time()
+        done = 0
+
+        if workers > 1:
+            print(f"Encoding {len(image_paths)} photos with {workers} worker processes...")
+            chunksize = max(1, len(image_paths) // (workers * 8))
+            try:
+                # Spawned, not forked: the loader may run beside the camera threads (background_load)
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context('spawn')) as executor:
+                    for result in executor.map(_encode_worker, image_paths, chunksize=chunksize):
+                        done += 1
+                        yield result
+            except BrokenProcessPool as e:
+                print(f"Worker pool failed ({str(e)}), encoding remaining photos in this process")
+
+        for image_path in image_paths[done:]:
+            done += 1
+            yield _encode_worker(image_path)
+
+        elapsed = time.time() - start
+        rate = done / elapsed if elapsed > 0 else 0
+        print(f"Encoded {done} photos in {elapsed:.1f}s ({rate:.1f} images/sec)")
+
+    def ann_index_path(self):
+        """Saved IVF index, next to the images directory (known_faces -> known_faces_ivf.npz)"""
+        return os.path.normpath(os.path.abspath(self.images_dir)) + '_ivf.npz'
+
+    def load_ann_index(self, n_probe):
+        """
+        Switch the matcher to an approximate IVF index for very large galleries
+
+        The index is saved next to the images directory and reused on later
+        starts as long as the gallery it was built from has not changed.
+        """
+        if not len(self.matcher):
+            # k-means needs at least one vector; an empty gallery is matched exactly
+            print("No encodings to index yet; matching without the approximate index")
+            return
+
+        index_path = self.ann_index_path()
+        vectors = self.matcher.rows()
+        gallery_fingerprint = fingerprint(vectors)
+        index = None
+        if os.path.exists(index_path):
+            try:
+                index = IVFIndex.load(index_path)
+                if index.fingerprint != gallery_fingerprint:
+                    index = None
+            except Exception as e:
+                print(f"Ignoring unreadable index {index_path}: {str(e)}")
+                index = None
+
+        if index is None:
+            print(f"Building approximate index over {len(self.matcher)} encodings...")
+            start = time.time()
+            index = IVFIndex().build(vectors)
+            index.save(index_path)
+            print(f"Built {index.n_lists}-list index in {time.time() - start:.1f}s")
+        else:
+            print(f"Loaded approximate index from {index_path}")
+
+        index.n_probe = n_probe
+        self.matcher.use_index(index)
 
     def mark_attendance(self, name):
-        """Mark attendance for a recognized face"""
-        now = datetime.now()
-        date_string = now.strftime('%Y-%m-%d')
-        time_string = now.strftime('%H:%M:%S')
-        
-        df = pd.read_csv(self.attendance_file)
-        
-        # Check if attendance already marked for today
-        if not ((df['Name'] == name) & (df['Date'] == date_string)).any():
-            new_row = {'Name': name, 'Date': date_string, 'Time': time_string}
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            df.to_csv(self.attendance_file, index=False)
+        """Mark attendance for a recognized face; returns the time marked, or None if already marked today"""
+        with self.metrics.time('mark_attendance'):
+            time_string = self.attendance_store.mark(name)
+        if time_string:
+            self.metrics.count('attendance_marks')
             print(f"\nMarked attendance for {name} at {time_string}")
             self.today_attendance.add(name)
+            for callback in self.mark_callbacks:
+                callback(name, time_string)
+        return time_string
 
     def draw_dashboard(self, frame):
         """Draw status dashboard on the frame"""
-        height, width = frame.shape[:2]
-        
         # Calculate FPS
         self.frame_count += 1
         if self.frame_count % 30 == 0:
@@ -127,54 +464,37 @@ class AttendanceSystem:
             self.fps = 30 / time_diff if time_diff > 0 else 0
             self.last_time = current_time
 
-        # Draw semi-transparent overlay for dashboard
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (0, 0), (width, 100), (50, 50, 50), -1)
-        cv2.addWeighted(overlay, 0.7, frame, 0.3, 0, frame)
-
-        # Draw dashboard content
+        # Dashboard content
         now = datetime.now()
         date_str = now.strftime("%Y-%m-%d")
         time_str = now.strftime("%H:%M:%S")
-        
-        # Title and time
-        cv2.putText(frame, "Face Recognition Attendance System", (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-        cv2.putText(frame, f"Date: {date_str} | Time: {time_str}", (10, 70),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        
-        # Status information
-        status_text = f"FPS: {self.fps:.1f} | Registered: {len(set(self.known_face_names))} | Present Today: {len(self.today_attendance)}"
-        cv2.putText(frame, status_text, (width - 400, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        
-        # Controls
-        controls_text = "Controls: Q - Quit | R - Reset Daily Attendance"
-        cv2.putText(frame, controls_text, (width - 400, 70),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+        info_text = f"Date: {date_str} | Time: {time_str}"
+        if self.latency_ms is not None:
+            info_text += f" | Latency: {self.latency_ms:.0f} ms"
+        if self.gallery_ready.is_set():
+            status_text = f"FPS: {self.fps:.1f} | Registered: {len(self.matcher.identities)} | Present Today: {len(self.today_attendance)}"
+        else:
+            done, total = self.load_progress
+            status_text = f"FPS: {self.fps:.1f} | Loading gallery: {done}/{total} photos"
+
+        self.overlay.draw_dashboard(frame, info_text, status_text)
 
     def draw_face_box(self, frame, face_location, name):
         """Draw face detection box and name label"""
-        top, right, bottom, left = face_location
-        
-        # Draw face box
-        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-        
-        # Draw name label with background
-        label_bg = frame.copy()
-        cv2.rectangle(label_bg, (left, bottom - 35), (right, bottom), (0, 255, 0), -1)
-        cv2.addWeighted(label_bg, 0.7, frame, 0.3, 0, frame)
-        cv2.putText(frame, name, (left + 6, bottom - 6),
-                   cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
-
-    def start_recognition(self):
-        """Start the face recognition system"""
-        print("\nStarting face recognition system...")
-        print("Controls:")
-        print("- Press 'q' to quit")
-        print("- Press 'r' to reset daily attendance")
-        
-        # Initialize the webcam with multiple attempts
+        self.overlay.draw_face_box(frame, face_location, name)
+
+    def frame_shown(self):
+        """Called after each imshow; reports the time from start-up to the first displayed frame"""
+        if self.first_frame_shown:
+            return
+        self.first_frame_shown = True
+        elapsed = time.perf_counter() - STARTED
+        self.metrics.gauge('time_to_first_frame_seconds', round(elapsed, 3))
+        loading = "" if self.gallery_ready.is_set() else " (gallery still loading)"
+        print(f"\nFirst frame shown {elapsed:.2f}s after start-up{loading}")
+
+    def open_camera(self):
+        """Open the webcam with multiple attempts; returns None if it cannot be opened"""
         cap = None
         for attempt in range(3):
             print(f"Attempting to open webcam (attempt {attempt+1}/3)...")
@@ -187,59 +507,255 @@ class AttendanceSystem:
         if not cap or not cap.isOpened():
             print("Error: Could not open webcam after multiple attempts!")
             print("Please check if your webcam is connected and not in use by another application.")
-            return
+            return None
             
         # Wait a moment for the camera to initialize
         time.sleep(1)
-        
-        print("\nWebcam started successfully!")
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("Error: Could not read frame, retrying...")
-                time.sleep(0.5)
-                continue
+        return cap
 
-            # Resize frame for faster processing
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    def recognize(self, frame):
+        """
+        Find, identify and mark attendance for the faces in a BGR frame
 
-            # Find faces in the frame
-            face_locations = face_recognition.face_locations(rgb_small_frame)
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+        Returns:
+            List of (face_location, name) with locations in frame coordinates
+        """
+        with self.metrics.time('recognize'):
+            self.metrics.count('frames')
 
-            # Draw dashboard
-            self.draw_dashboard(frame)
+            # Nothing to match against until the gallery has loaded
+            if not self.gallery_ready.is_set():
+                return []
+
+            if self.motion_gate is not None:
+                with self.metrics.time('motion_gate'):
+                    detect = self.motion_gate.should_detect(frame)
+                self.metrics.gauge('skipped_frame_ratio', round(self.motion_gate.skipped_ratio, 4))
+                if not detect:
+                    self.metrics.count('skipped_frames')
+                    return self.last_results
+
+            # Resize frame for faster processing
+            scale = self.detect_scale or self.scaler.choose(*frame.shape[:2])
+            self.metrics.gauge('detect_scale', scale)
+            with self.metrics.time('resize'):
+                small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1 else frame
+            with self.metrics.time('cvt_color'):
+                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
 
-            # Process each face
-            for face_encoding, face_location in zip(face_encodings, face_locations):
-                matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding)
+            if self.tracker is not None:
+                with self.tracker_lock:
+                    self.last_results = self._recognize_tracked(small_frame, rgb_small_frame, scale)
+                return self.last_results
+
+            results = []
+            for face_location, match in identify_faces(rgb_small_frame, self.matcher, scale=scale,
+                                                       metrics=self.metrics, scaler=self.scaler,
+                                                       frame=frame, detector=self.detector):
                 name = "Unknown"
 
-                if True in matches:
-                    first_match_index = matches.index(True)
-                    name = self.known_face_names[first_match_index]
+                if match.name is not None:
+                    name = match.name
                     self.mark_attendance(name)
+                else:
+                    self.metrics.count('unknown_faces')
+                    if self.evidence is not None:
+                        self.evidence.trigger('unknown')
 
-                # Draw face box and label
-                self.draw_face_box(frame, [coord * 4 for coord in face_location], name)
+                results.append((face_location, name))
+            self.metrics.count('faces_detected', len(results))
+            prototypes = self.matcher.prototypes
+            if prototypes is not None and prototypes.matched + prototypes.fallbacks:
+                self.metrics.gauge('prototype_fallback_ratio', round(
+                    prototypes.fallbacks / (prototypes.matched + prototypes.fallbacks), 4))
+            self.last_results = results
+            return results
 
-            cv2.imshow('Face Recognition Attendance System', frame)
+    def _recognize_tracked(self, small_frame, rgb_small_frame, scale):
+        """Detect every N frames, follow the boxes in between, and encode only new or uncertain tracks"""
+        import face_recognition
 
-            # Handle key presses
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q'):
-                print("\nShutting down...")
-                break
-            elif key == ord('r'):
-                self.today_attendance.clear()
-                print("\nDaily attendance reset!")
+        gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
+
+        if self.tracker.detection_due():
+            with self.metrics.time('face_locations'):
+                face_locations = self.detector.detect(rgb_small_frame)
+            self.tracker.update(face_locations, gray)
+
+            pending = self.tracker.to_encode()
+            if pending:
+                with self.metrics.time('face_encodings'):
+                    face_encodings = face_recognition.face_encodings(rgb_small_frame, [t.box for t in pending])
+                with self.metrics.time('match'):
+                    matches = self.matcher.match(face_encodings)
+                for track, match in zip(pending, matches):
+                    self.tracker.assign(track, match, self.matcher.tolerance)
+                    if match.name is not None:
+                        self.mark_attendance(match.name)
+        else:
+            with self.metrics.time('track_propagate'):
+                self.tracker.propagate(gray)
+
+        visible = self.tracker.visible()
+        self.metrics.count('faces_detected', len(visible))
+        unknown = sum(1 for track in visible if track.name is None)
+        self.metrics.count('unknown_faces', unknown)
+        if unknown and self.evidence is not None:
+            self.evidence.trigger('unknown')
+        return [(to_frame_location(track.box, scale), track.name or "Unknown") for track in visible]
+
+    def render(self, frame, results):
+        """Draw the dashboard and the face boxes for a set of recognition results"""
+        with self.metrics.time('draw_dashboard'):
+            self.draw_dashboard(frame)
+        with self.metrics.time('draw_face_box'):
+            for face_location, name in results:
+                self.draw_face_box(frame, face_location, name)
+        self.metrics.gauge('fps', round(self.fps, 2))
+
+    def handle_key(self, key):
+        """Handle a key press; returns False when the user asked to quit"""
+        if key == ord('q'):
+            print("\nShutting down...")
+            return False
+        elif key == ord('r'):
+            self.today_attendance.clear()
+            print("\nDaily attendance reset!")
+        return True
+
+    def start_recognition(self, pipeline_workers=1, queue_size=1, watch_interval=5.0):
+        """
+        Start the face recognition system
+
+        Args:
+            pipeline_workers: Recognition threads running behind the capture and
+                render loop (0 runs capture, recognition and display serially)
+            queue_size: Frames that may wait for a recognition worker; older
+                frames are dropped when the queue is full
+            watch_interval: Seconds between checks of the images directory for
+                added or removed photos (0 disables hot reload)
+        """
+        print("\nStarting face recognition system...")
+        print("Controls:")
+        print("- Press 'q' to quit")
+        print("- Press 'r' to reset daily attendance")
+        
+        cap = self.open_camera()
+        if cap is None:
+            return
+        
+        print("\nWebcam started successfully!")
+
+        watcher = None
+        if watch_interval:
+            # Imported here because gallery_watcher itself imports this module
+            from gallery_watcher import GalleryWatcher
+            watcher = GalleryWatcher(self, watch_interval)
+            watcher.start()
+
+        try:
+            if pipeline_workers > 0:
+                RecognitionPipeline(self, cap, pipeline_workers, queue_size).run(WINDOW_NAME)
+            else:
+                self._run_serial(cap)
+        finally:
+            if watcher:
+                watcher.stop()
 
         cap.release()
         cv2.destroyAllWindows()
+        if self.motion_gate is not None and self.motion_gate.checked:
+            print(f"Motion gating skipped detection on {self.motion_gate.skipped} of "
+                  f"{self.motion_gate.checked} frames ({self.motion_gate.skipped_ratio:.0%})")
+        if self.evidence is not None:
+            self.evidence.close()
+        self.attendance_store.flush()
+        self.metrics.close()
+
+    def _run_serial(self, cap):
+        """Capture, recognize and display each frame in turn on the calling thread"""
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                print("Error: Could not read frame, retrying...")
+                time.sleep(0.5)
+                continue
+
+            if self.evidence is not None:
+                # The frame is drawn on below, so the buffer keeps its own copy
+                self.evidence.add(frame, copy=True)
+            self.render(frame, self.recognize(frame))
+            cv2.imshow(WINDOW_NAME, frame)
+            self.frame_shown()
+
+            # Handle key presses
+            if not self.handle_key(cv2.waitKey(1) & 0xFF):
+                break
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face Recognition Attendance System")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes used to encode new photos (0 = one per CPU core)")
+    parser.add_argument('--no-cache', action='store_true', help="ignore the gallery cache")
+    parser.add_argument('--tolerance', type=float, default=0.6,
+                        help="maximum face distance for a match (lower is stricter)")
+    parser.add_argument('--ann-probe', type=int, default=None,
+                        help="match through an approximate IVF index scanning this many cells "
+                             "(higher = better recall, slower); for very large galleries")
+    parser.add_argument('--int8-gallery', action='store_true',
+                        help="store the gallery as int8 codes (a quarter of the memory; see face_matcher.py)")
+    parser.add_argument('--no-condense', action='store_true',
+                        help="match every face against all photos instead of per-person prototypes first")
+    parser.add_argument('--detect-interval', type=int, default=1,
+                        help="run full face detection every N frames and track faces in between")
+    parser.add_argument('--detect-scale', type=float, default=None,
+                        help="detect faces on the frame resized by this fixed factor (e.g. 0.25) "
+                             "instead of choosing the scale per frame")
+    parser.add_argument('--detector', default='auto', choices=['auto', 'hog', 'haar', 'lbp', 'dnn'],
+                        help="face detector backend ('auto' = the one picked by "
+                             "'python face_detectors.py calibrate', HOG if never calibrated)")
+    parser.add_argument('--detect-budget', type=float, default=50.0,
+                        help="target face detection time in ms when the scale is chosen per frame")
+    parser.add_argument('--motion-threshold', type=float, default=0.01,
+                        help="skip detection unless this fraction of the (downsampled) frame changed "
+                             "since the last detection (0 = detect on every frame)")
+    parser.add_argument('--motion-delta', type=int, default=25,
+                        help="grey-level change for a pixel to count as changed (lower = more sensitive)")
+    parser.add_argument('--force-detect', type=float, default=2.0,
+                        help="seconds after which detection runs even if nothing moved")
+    parser.add_argument('--pipeline-workers', type=int, default=1,
+                        help="recognition threads behind the capture/render loop (0 = serial loop)")
+    parser.add_argument('--queue-size', type=int, default=1,
+                        help="frames that may wait for recognition before older ones are dropped")
+    parser.add_argument('--watch-interval', type=float, default=5.0,
+                        help="seconds between checks of known_faces/ for new or deleted photos (0 = off)")
+    parser.add_argument('--evidence', action='store_true',
+                        help="save the last seconds of frames to output_frames/ on every mark and unknown face")
+    parser.add_argument('--evidence-seconds', type=float, default=3.0, help="seconds of frames saved per event")
+    parser.add_argument('--evidence-fps', type=float, default=10.0, help="frames per second kept for evidence")
+    parser.add_argument('--evidence-max-mb', type=float, default=500.0,
+                        help="delete the oldest evidence frames beyond this much disk space")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--metrics-json', default=None, help="periodically write a JSON metrics snapshot here")
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help="seconds between JSON metrics snapshots")
+    args = parser.parse_args()
+
     print("=== Face Recognition Attendance System ===\n")
-    system = AttendanceSystem()
-    system.start_recognition()
+    system = AttendanceSystem(use_cache=not args.no_cache, workers=args.workers,
+                              tolerance=args.tolerance, ann_probe=args.ann_probe,
+                              detect_interval=args.detect_interval, detect_scale=args.detect_scale,
+                              detect_budget_ms=args.detect_budget, motion_threshold=args.motion_threshold,
+                              motion_delta=args.motion_delta, force_detect=args.force_detect,
+                              detector=args.detector, background_load=True, quantize=args.int8_gallery,
+                              condense=not args.no_condense)
+    if args.evidence:
+        system.enable_evidence(seconds=args.evidence_seconds, fps=args.evidence_fps,
+                               max_bytes=int(args.evidence_max_mb * 2**20))
+    if args.metrics_port:
+        system.metrics.serve(args.metrics_port)
+    if args.metrics_json:
+        system.metrics.dump_periodically(args.metrics_json, args.metrics_interval)
+    system.start_recognition(pipeline_workers=args.pipeline_workers, queue_size=args.queue_size,
+                             watch_interval=args.watch_interval)
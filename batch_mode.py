@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+
+from attendance_system import AttendanceSystem, IMAGE_EXTENSIONS, identify_faces
+
+
+def resolve_source(source):
+    """
+    Work out what kind of input a source string is
+
+    Returns:
+        ('video', path) or ('images', sorted list of image paths)
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, f) for f in os.listdir(source)]
+        return 'images', sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+    if os.path.isfile(source) and not source.lower().endswith(IMAGE_EXTENSIONS):
+        return 'video', source
+    paths = glob.glob(source, recursive=True)
+    return 'images', sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def video_frames(path, start=0, stop=None, stride=1):
+    """
+    Yield (frame_index, seconds, frame) from a video file
+
+    Frames skipped by the stride are only grabbed, not decoded.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    index = start
+    try:
+        while stop is None or index < stop:
+            if (index - start) % stride:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield index, (index / fps if fps else None), frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def image_frames(paths, stride=1):
+    """Yield (frame_index, path, frame) for every stride-th readable image"""
+    for index in range(0, len(paths), stride):
+        frame = cv2.imread(paths[index])
+        if frame is None:
+            print(f"Could not read {paths[index]}", file=sys.stderr)
+            continue
+        yield index, paths[index], frame
+
+
+def iter_frames(source, stride=1):
+    """Stream (frame_index, position, frame) from a video file, image directory or glob"""
+    kind, target = resolve_source(source)
+    if kind == 'video':
+        return video_frames(target, stride=stride)
+    return image_frames(target, stride)
+
+
+def recognize_frame(frame, matcher, scale=0.25, metrics=None, detector=None):
+    """Identify faces in a BGR frame; returns [{'box': [top, right, bottom, left], 'name', 'distance'}]"""
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    faces = []
+    for face_location, match in identify_faces(rgb_small_frame, matcher, scale=scale,
+                                               metrics=metrics, detector=detector):
+        faces.append({'box': [int(c) for c in face_location],
+                      'name': match.name or "Unknown",
+                      'distance': round(match.distance, 4) if match.distance != float('inf') else None})
+    return faces
+
+
+_worker_matcher = None
+_worker_detector = None
+
+
+def _init_worker(matcher, detector=None):
+    global _worker_matcher, _worker_detector
+    _worker_matcher = matcher
+    _worker_detector = detector
+
+
+def _process_chunk(task):
+    """Worker: recognize one chunk of a video (or a list of images) and return per-frame results"""
+    kind, target, start, stop, stride = task
+    frames = video_frames(target, start, stop, stride) if kind == 'video' \
+        else image_frames(target[start:stop], stride)
+    results = []
+    for index, position, frame in frames:
+        if kind == 'images':
+            index += start
+        results.append((index, position, recognize_frame(frame, _worker_matcher, detector=_worker_detector)))
+    return results
+
+
+def _chunks(kind, target, stride, chunk_size):
+    """Split a source into (kind, target, start, stop, stride) tasks aligned to the stride"""
+    if kind == 'video':
+        cap = cv2.VideoCapture(target)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        cap.release()
+        if total <= 0:
+            return [(kind, target, 0, None, stride)]
+    else:
+        total = len(target)
+    step = max(stride, (chunk_size // stride) * stride)
+    return [(kind, target, start, min(start + step, total), stride) for start in range(0, total, step)]
+
+
+def run_batch(system, source, output, stride=1, workers=1, chunk_size=300):
+    """
+    Run recognition over a recorded source and write one JSON line per processed frame
+
+    Attendance is marked in frame order in this process, so results are the
+    same whatever the number of workers. Returns a summary dict.
+    """
+    kind, target = resolve_source(source)
+    if kind == 'images' and not target:
+        raise IOError(f"No images found for {source}")
+
+    source_name = target if kind == 'video' else source
+    frames = faces = 0
+    marks = []
+    start_time = time.time()
+
+    def emit(index, position, frame_faces):
+        nonlocal frames, faces
+        frames += 1
+        faces += len(frame_faces)
+        record = {'source': source_name, 'frame': index}
+        if kind == 'video':
+            record['seconds'] = None if position is None else round(position, 3)
+        else:
+            record['image'] = position
+        record['faces'] = frame_faces
+        for face in frame_faces:
+            if face['name'] != "Unknown":
+                time_string = system.mark_attendance(face['name'])
+                if time_string:
+                    marks.append({'name': face['name'], 'time': time_string, 'frame': index})
+                    face['marked'] = True
+        output.write(json.dumps(record) + "\n")
+
+    if workers > 1:
+        tasks = _chunks(kind, target, stride, chunk_size)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(system.matcher, system.detector)) as executor:
+            for chunk in executor.map(_process_chunk, tasks):
+                for result in chunk:
+                    emit(*result)
+    else:
+        for index, position, frame in iter_frames(source, stride):
+            emit(index, position, recognize_frame(frame, system.matcher, metrics=system.metrics,
+                                                       detector=system.detector))
+
+    system.attendance_store.flush()
+    elapsed = time.time() - start_time
+    summary = {'summary': True, 'source': source_name, 'frames': frames, 'faces': faces,
+               'marks': marks, 'seconds': round(elapsed, 3),
+               'fps': round(frames / elapsed, 2) if elapsed > 0 else None}
+    output.write(json.dumps(summary) + "\n")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless attendance recognition over a video file, "
+                                                 "image directory or image glob")
+    parser.add_argument('source', help="video file, directory of images or glob such as 'output_frames/*.jpg'")
+    parser.add_argument('--output', default='batch_results.jsonl', help="JSON-lines result file ('-' for stdout)")
+    parser.add_argument('--stride', type=int, default=1, help="process every Nth frame")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="recognition processes, each handling a chunk of the input (0 = one per CPU core)")
+    parser.add_argument('--chunk-size', type=int, default=300, help="frames per worker chunk")
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    # Keep stdout clean for the JSON stream when writing results there
+    log = sys.stderr if output is sys.stdout else sys.stdout
+    try:
+        with contextlib.redirect_stdout(log):
+            system = AttendanceSystem(workers=workers, tolerance=args.tolerance)
+            summary = run_batch(system, args.source, output, max(1, args.stride), workers, args.chunk_size)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"\nProcessed {summary['frames']} frames ({summary['fps']} frames/sec), "
+          f"{summary['faces']} faces, {len(summary['marks'])} new attendance marks", file=log)
@@ -0,0 +1,275 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+import face_recognition
+
+from attendance_system import AttendanceSystem, list_face_images
+from ann_index import synthetic_gallery
+from face_matcher import FaceMatcher
+
+RESOLUTIONS = {'480p': (640, 480), '720p': (1280, 720), '1080p': (1920, 1080)}
+
+
+def time_stage(fn, repeat=20, warmup=2):
+    """Run fn repeatedly and return timing statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {
+        'runs': repeat,
+        'median_ms': round(float(np.median(samples)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'mean_ms': round(float(samples.mean()), 4),
+        'min_ms': round(float(samples.min()), 4),
+    }
+
+
+def load_face_crops(images_dir='known_faces', limit=16):
+    """Face photos used to build synthetic frames; falls back to none if the directory is empty"""
+    crops = []
+    if os.path.isdir(images_dir):
+        for path, _ in list_face_images(images_dir)[:limit]:
+            image = cv2.imread(path)
+            if image is not None:
+                crops.append(image)
+    return crops
+
+
+def make_frame(width, height, faces, crops, rng):
+    """A deterministic BGR frame with `faces` face photos pasted onto a noisy background"""
+    frame = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+    if not crops or not faces:
+        return frame
+    cols = int(np.ceil(np.sqrt(faces)))
+    rows = int(np.ceil(faces / cols))
+    cell_w, cell_h = width // cols, height // rows
+    size = int(min(cell_w, cell_h) * 0.8)
+    for i in range(faces):
+        crop = cv2.resize(crops[i % len(crops)], (size, size))
+        x = (i % cols) * cell_w + (cell_w - size) // 2
+        y = (i // cols) * cell_h + (cell_h - size) // 2
+        frame[y:y + size, x:x + size] = crop
+    return frame
+
+
+def load_recorded_frames(frames_dir, limit=20):
+    paths = sorted(os.path.join(frames_dir, f) for f in os.listdir(frames_dir)
+                   if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    frames = [cv2.imread(p) for p in paths[:limit]]
+    return [f for f in frames if f is not None]
+
+
+def bench_frame_stages(frames, params, repeat):
+    """Time resize, colour conversion, detection and encoding, cycling through a list of frames"""
+    small = [cv2.resize(f, (0, 0), fx=0.25, fy=0.25) for f in frames]
+    rgb = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in small]
+    locations = [face_recognition.face_locations(f) for f in rgb]
+    counter = iter(range(10 ** 9))
+
+    def cycle(items):
+        return items[next(counter) % len(items)]
+
+    def encode():
+        i = next(counter) % len(rgb)
+        face_recognition.face_encodings(rgb[i], locations[i])
+
+    stages = {
+        'resize': lambda: cv2.resize(cycle(frames), (0, 0), fx=0.25, fy=0.25),
+        'cvt_color': lambda: cv2.cvtColor(cycle(small), cv2.COLOR_BGR2RGB),
+        'face_locations': lambda: face_recognition.face_locations(cycle(rgb)),
+        'face_encodings': encode,
+    }
+    detected = round(sum(len(l) for l in locations) / len(locations), 2)
+    return [{'stage': stage, **params, 'faces_detected': detected, **time_stage(fn, repeat)}
+            for stage, fn in stages.items()]
+
+
+def bench_matching(gallery_sizes, faces_per_frame, repeat):
+    results = []
+    rng = np.random.default_rng(0)
+    for size in gallery_sizes:
+        vectors, labels = synthetic_gallery(size, seed=size)
+        names = [f"person_{l}" for l in labels]
+        matcher = FaceMatcher(vectors, names)
+        quantized = FaceMatcher(vectors, names, quantize=True)
+        for faces in faces_per_frame:
+            queries = vectors[rng.integers(0, size, faces)] + rng.normal(0, 0.02, (faces, 128)).astype(np.float32)
+            results.append({'stage': 'match', 'gallery': size, 'faces': faces,
+                            **time_stage(lambda: matcher.match(queries), repeat)})
+            results.append({'stage': 'match_int8', 'gallery': size, 'faces': faces,
+                            **time_stage(lambda: quantized.match(queries), repeat)})
+    return results
+
+
+def bench_system_stages(resolutions, faces_per_frame, repeat):
+    """Time mark_attendance and the drawing methods on a throwaway AttendanceSystem"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        system = AttendanceSystem(use_cache=False, images_dir=os.path.join(tmp, 'faces'),
+                                  attendance_file=os.path.join(tmp, 'attendance.csv'))
+        system.mark_attendance('already_marked')
+        results.append({'stage': 'mark_attendance', 'case': 'repeat',
+                        **time_stage(lambda: system.mark_attendance('already_marked'), repeat * 10)})
+        counter = iter(range(10 ** 9))
+        results.append({'stage': 'mark_attendance', 'case': 'new',
+                        **time_stage(lambda: system.mark_attendance(f"person_{next(counter)}"), repeat * 10)})
+        system.attendance_store.close()
+
+        for label in resolutions:
+            width, height = RESOLUTIONS[label]
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+            results.append({'stage': 'draw_dashboard', 'resolution': label,
+                            **time_stage(lambda: system.draw_dashboard(frame), repeat)})
+            for faces in faces_per_frame:
+                # Lay the boxes out in a grid below the dashboard
+                size = min(width, height) // 5
+                cols = max(1, width // (size + 10))
+                boxes = []
+                for i in range(faces):
+                    left = 10 + (i % cols) * (size + 10)
+                    top = 110 + (i // cols) * (size + 10)
+                    boxes.append((top, left + size, top + size, left))
+
+                def draw_boxes():
+                    for box in boxes:
+                        system.draw_face_box(frame, box, "person")
+
+                results.append({'stage': 'draw_face_box', 'resolution': label, 'faces': faces,
+                                **time_stage(draw_boxes, repeat)})
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+
+def run_benchmarks(args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    if args.frames_dir:
+        frames = load_recorded_frames(args.frames_dir)
+        if not frames:
+            raise IOError(f"No readable frames in {args.frames_dir}")
+        print(f"Timing frame stages on {len(frames)} recorded frames...", file=sys.stderr)
+        results += bench_frame_stages(frames, {'frames': args.frames_dir}, args.repeat)
+    else:
+        crops = load_face_crops(args.images_dir)
+        for label in args.resolutions:
+            width, height = RESOLUTIONS[label]
+            for faces in args.faces:
+                print(f"Timing frame stages at {label} with {faces} faces...", file=sys.stderr)
+                frames = [make_frame(width, height, faces, crops, rng) for _ in range(4)]
+                results += bench_frame_stages(frames, {'resolution': label, 'faces': faces}, args.repeat)
+
+    print("Timing matching...", file=sys.stderr)
+    results += bench_matching(args.gallery_sizes, args.faces, args.repeat)
+    print("Timing attendance marking and drawing...", file=sys.stderr)
+    results += bench_system_stages(args.resolutions, args.faces, args.repeat)
+    return {'environment': environment(), 'results': results}
+
+
+def result_key(row):
+    """Identify a result row by its stage and parameters, ignoring the timings"""
+    return tuple(sorted((k, str(v)) for k, v in row.items()
+                        if not k.endswith('_ms') and k not in ('runs', 'faces_detected')))
+
+
+def compare_reports(old, new, threshold=0.10, min_ms=0.05):
+    """
+    Compare median timings of two reports
+
+    Returns:
+        List of (row, old_ms, new_ms, change) for rows slower by more than threshold
+    """
+    old_rows = {result_key(r): r for r in old['results']}
+    regressions = []
+    for row in new['results']:
+        before = old_rows.get(result_key(row))
+        if not before:
+            continue
+        old_ms, new_ms = before['median_ms'], row['median_ms']
+        if new_ms - old_ms < min_ms:
+            continue
+        change = (new_ms - old_ms) / old_ms if old_ms > 0 else float('inf')
+        if change > threshold:
+            regressions.append((row, old_ms, new_ms, change))
+    return regressions
+
+
+def describe(row):
+    params = ', '.join(f"{k}={v}" for k, v in row.items()
+                       if k != 'stage' and not k.endswith('_ms') and k not in ('runs', 'faces_detected'))
+    return f"{row['stage']} ({params})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the recognition hot path")
+    sub = parser.add_subparsers(dest='command')
+
+    run = sub.add_parser('run', help="run the benchmarks and write a JSON report")
+    run.add_argument('--output', default='benchmark_report.json')
+    run.add_argument('--repeat', type=int, default=20)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--gallery-sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000])
+    run.add_argument('--faces', type=int, nargs='+', default=[1, 4, 8], help="faces per frame")
+    run.add_argument('--resolutions', nargs='+', default=['480p', '720p', '1080p'], choices=list(RESOLUTIONS))
+    run.add_argument('--frames-dir', help="time the frame stages on recorded frames instead of synthetic ones")
+    run.add_argument('--images-dir', default='known_faces', help="face photos pasted into synthetic frames")
+
+    cmp = sub.add_parser('compare', help="flag stages that got slower between two reports")
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.10, help="allowed slowdown as a fraction (0.10 = 10%%)")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        report = run_benchmarks(args)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        for row in report['results']:
+            print(f"{describe(row):70s} median {row['median_ms']:9.3f} ms  p95 {row['p95_ms']:9.3f} ms")
+        print(f"\nWrote {args.output}")
+    elif args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare_reports(old, new, args.threshold)
+        print(f"Comparing {old['environment'].get('commit')} -> {new['environment'].get('commit')}")
+        for row, old_ms, new_ms, change in regressions:
+            print(f"REGRESSION {describe(row)}: {old_ms:.3f} ms -> {new_ms:.3f} ms (+{change:.0%})")
+        if not regressions:
+            print("No regressions above the threshold")
+        sys.exit(1 if regressions else 0)
+    else:
+        parser.print_help()
@@ -0,0 +1,183 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import cv2
+import numpy as np
+
+FRAME_PREFIX = 'frame_'
+
+
+class EvidenceRecorder:
+    """
+    Keeps the last few seconds of camera frames and saves them when something happens
+
+    add() is called for every frame on the camera loop. It only keeps a
+    reference to at most `fps` frames per second in a ring buffer, so it
+    costs next to nothing; its duration is exported as the evidence_add
+    metric. Callers that draw on the frame (the serial loop) ask for a copy,
+    which goes into the buffer of the frame leaving the ring unless a queued
+    event still holds it. trigger() hands the buffered frames to writer
+    threads through a bounded queue: when the writers fall behind, new events
+    are dropped and counted instead of blocking the camera. The same event
+    key (a person's name, or 'unknown') is saved at most once per cooldown.
+    Frames are written as output_dir/frame_<timestamp>.jpg, the oldest are
+    deleted once the directory holds more than max_bytes of frames, and each
+    event is logged to output_dir/events.csv.
+    """
+
+    def __init__(self, output_dir='output_frames', seconds=3.0, fps=10.0, max_bytes=500 * 2**20,
+                 writers=1, queue_size=4, cooldown=10.0, quality=90, metrics=None):
+        self.output_dir = output_dir
+        self.interval = 1.0 / fps if fps else 0.0
+        self.buffer = deque(maxlen=max(1, int(seconds * fps)) if fps else None)
+        self.max_bytes = max_bytes
+        self.cooldown = cooldown
+        self.quality = quality
+        self.metrics = metrics
+        self.jobs = queue.Queue(maxsize=max(1, queue_size))
+        self.last_kept = 0.0
+        self.last_event = {}
+        self.pinned = {}
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        # Frames already on disk count towards the cap, oldest first
+        self.files = deque()
+        self.total_bytes = 0
+        entries = [e for e in os.scandir(output_dir)
+                   if e.is_file() and e.name.startswith(FRAME_PREFIX) and e.name.endswith('.jpg')]
+        for entry in sorted(entries, key=lambda e: e.name):
+            self.files.append((entry.path, entry.stat().st_size))
+            self.total_bytes += entry.stat().st_size
+        self._rotate()
+
+        self.threads = [threading.Thread(target=self._write_loop, name=f'evidence-writer-{i}', daemon=True)
+                        for i in range(max(1, writers))]
+        for thread in self.threads:
+            thread.start()
+
+    def add(self, frame, copy=False):
+        """Offer a BGR frame to the ring buffer; pass copy=True if the caller draws on it afterwards"""
+        start = time.perf_counter()
+        if start - self.last_kept >= self.interval:
+            self.last_kept = start
+            self.buffer.append((datetime.now(), self._copy(frame) if copy else frame))
+        if self.metrics:
+            self.metrics.observe('evidence_add', time.perf_counter() - start)
+
+    def _copy(self, frame):
+        """Copy a frame, reusing the oldest buffered copy when no event is still writing it"""
+        if len(self.buffer) == self.buffer.maxlen:
+            old = self.buffer[0][1]
+            with self.lock:
+                free = id(old) not in self.pinned
+            if free and old.shape == frame.shape and old.dtype == frame.dtype:
+                self.buffer.popleft()
+                np.copyto(old, frame)
+                return old
+        return frame.copy()
+
+    def trigger(self, reason, name=None):
+        """Save the buffered frames for an event; returns False if it was rate-limited or dropped"""
+        key = name or reason
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_event.get(key, -self.cooldown) < self.cooldown:
+                return False
+            self.last_event[key] = now
+        frames = list(self.buffer)
+        if not frames:
+            return False
+        self._pin(frames, 1)
+        try:
+            self.jobs.put_nowait((datetime.now(), reason, name, frames))
+        except queue.Full:
+            self._pin(frames, -1)
+            self.dropped += 1
+            if self.metrics:
+                self.metrics.count('evidence_dropped')
+            return False
+        if self.metrics:
+            self.metrics.count('evidence_events')
+        return True
+
+    def _write_loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            try:
+                self._write(*job)
+            except Exception as e:
+                print(f"Error saving evidence frames: {str(e)}")
+            finally:
+                self._pin(job[3], -1)
+                self.jobs.task_done()
+
+    def _pin(self, frames, delta):
+        """Track the frames held by queued events so add() does not reuse their buffers"""
+        with self.lock:
+            for _, frame in frames:
+                count = self.pinned.get(id(frame), 0) + delta
+                if count > 0:
+                    self.pinned[id(frame)] = count
+                else:
+                    self.pinned.pop(id(frame), None)
+
+    def _write(self, event_time, reason, name, frames):
+        paths = []
+        for timestamp, frame in frames:
+            path = os.path.join(self.output_dir, f"{FRAME_PREFIX}{timestamp.strftime('%Y%m%d_%H%M%S_%f')}.jpg")
+            paths.append(path)
+            # Overlapping events share frames; each is written once
+            if os.path.exists(path):
+                continue
+            ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                continue
+            with open(path, 'wb') as f:
+                f.write(jpeg)
+            with self.lock:
+                self.files.append((path, len(jpeg)))
+                self.total_bytes += len(jpeg)
+                self.written += 1
+                self._rotate()
+            if self.metrics:
+                self.metrics.count('evidence_frames_written')
+
+        with self.lock:
+            with open(os.path.join(self.output_dir, 'events.csv'), 'a') as f:
+                f.write(f"{event_time.strftime('%Y-%m-%d %H:%M:%S')},{reason},{name or ''},"
+                        f"{os.path.basename(paths[0])},{os.path.basename(paths[-1])}\n")
+            if self.metrics:
+                self.metrics.gauge('evidence_bytes', self.total_bytes)
+
+    def _rotate(self):
+        """Delete the oldest frames until the directory is under max_bytes (caller holds the lock)"""
+        while self.total_bytes > self.max_bytes and self.files:
+            path, size = self.files.popleft()
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def close(self, timeout=10.0):
+        """Finish the queued events and stop the writers"""
+        deadline = time.monotonic() + timeout
+        for _ in self.threads:
+            try:
+                self.jobs.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if self.written or self.dropped:
+            print(f"Saved {self.written} evidence frames to {self.output_dir}"
+                  + (f" ({self.dropped} events dropped while the writer was busy)" if self.dropped else ""))
@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+from face_tracker import iou
+
+CALIBRATION_FILE = 'detector.json'
+MODELS_DIR = 'models'
+
+
+class HogDetector:
+    """face_recognition's HOG detector (the original behaviour)"""
+
+    name = 'hog'
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def detect(self, rgb_image):
+        import face_recognition
+        return face_recognition.face_locations(rgb_image, self.upsample)
+
+
+class CascadeDetector:
+    """
+    OpenCV Haar or LBP cascade
+
+    The Haar frontal-face model ships with opencv-python (cv2.data); LBP
+    models do not, so lbpcascade_frontalface_improved.xml from OpenCV's
+    data/lbpcascades has to be placed in models/ (or passed in). The
+    classifier is loaded on first use so the detector can be sent to worker
+    processes.
+    """
+
+    def __init__(self, kind='haar', model_path=None, scale_factor=1.1, min_neighbors=5, min_size=20):
+        self.name = kind
+        if model_path is None:
+            if kind != 'haar':
+                model_path = os.path.join(MODELS_DIR, 'lbpcascade_frontalface_improved.xml')
+            else:
+                model_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        self.model_path = model_path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.classifier = None
+
+    def __getstate__(self):
+        return {**self.__dict__, 'classifier': None}
+
+    def detect(self, rgb_image):
+        if self.classifier is None:
+            classifier = cv2.CascadeClassifier(self.model_path)
+            if classifier.empty():
+                raise IOError(f"Could not load cascade {self.model_path}")
+            self.classifier = classifier
+        gray = cv2.equalizeHist(cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY))
+        boxes = self.classifier.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                                 minNeighbors=self.min_neighbors,
+                                                 minSize=(self.min_size, self.min_size))
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in boxes]
+
+
+class DnnDetector:
+    """
+    OpenCV's ResNet-10 SSD face detector, run on the CPU through cv2.dnn
+
+    Needs deploy.prototxt and res10_300x300_ssd_iter_140000.caffemodel from
+    OpenCV's samples/dnn/face_detector in the models/ directory.
+    """
+
+    name = 'dnn'
+
+    def __init__(self, config_path=None, model_path=None, confidence=0.5, input_size=300):
+        self.config_path = config_path or os.path.join(MODELS_DIR, 'deploy.prototxt')
+        self.model_path = model_path or os.path.join(MODELS_DIR, 'res10_300x300_ssd_iter_140000.caffemodel')
+        self.confidence = confidence
+        self.input_size = input_size
+        self.net = None
+
+    def __getstate__(self):
+        return {**self.__dict__, 'net': None}
+
+    def detect(self, rgb_image):
+        if self.net is None:
+            for path in (self.config_path, self.model_path):
+                if not os.path.exists(path):
+                    raise IOError(f"DNN face detector model not found: {path}")
+            self.net = cv2.dnn.readNetFromCaffe(self.config_path, self.model_path)
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+        height, width = rgb_image.shape[:2]
+        # The model was trained on BGR input with these channel means
+        blob = cv2.dnn.blobFromImage(rgb_image, 1.0, (self.input_size, self.input_size),
+                                     (104.0, 177.0, 123.0), swapRB=True)
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        boxes = []
+        for confidence, x0, y0, x1, y1 in detections[:, 2:7]:
+            if confidence < self.confidence:
+                continue
+            left, right = max(0, int(x0 * width)), min(width, int(x1 * width))
+            top, bottom = max(0, int(y0 * height)), min(height, int(y1 * height))
+            if right > left and bottom > top:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+BACKENDS = {
+    'hog': HogDetector,
+    'haar': lambda: CascadeDetector('haar'),
+    'lbp': lambda: CascadeDetector('lbp'),
+    'dnn': DnnDetector,
+}
+
+
+def create_detector(name='auto', calibration_file=CALIBRATION_FILE):
+    """
+    Build a detector by name; 'auto' uses the backend chosen by the last calibration (HOG if none)
+    """
+    if name == 'auto':
+        name = 'hog'
+        if os.path.exists(calibration_file):
+            try:
+                with open(calibration_file) as f:
+                    name = json.load(f)['backend']
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable detector calibration {calibration_file}: {str(e)}")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown face detector '{name}' (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+def count_hits(truth, found, iou_threshold=0.3):
+    """Ground-truth boxes matched by a detection (greedy, each detection used once)"""
+    unused = list(found)
+    hits = 0
+    for box in truth:
+        best = max(unused, key=lambda d: iou(box, d), default=None)
+        if best is not None and iou(box, best) >= iou_threshold:
+            unused.remove(best)
+            hits += 1
+    return hits
+
+
+def load_samples(paths, labels_file=None):
+    """
+    (path, rgb_image, ground_truth_boxes) for each sample image
+
+    Ground truth comes from a JSON file {path: [[top, right, bottom, left], ...]}
+    when given; otherwise from a slow, thorough reference run (HOG with two
+    upsampling passes on the full-resolution image).
+    """
+    labels = None
+    if labels_file:
+        with open(labels_file) as f:
+            labels = {os.path.normpath(k): v for k, v in json.load(f).items()}
+    reference = HogDetector(upsample=2)
+    samples = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping unreadable sample {path}")
+            continue
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if labels is not None:
+            truth = [tuple(box) for box in labels.get(os.path.normpath(path), [])]
+        else:
+            truth = reference.detect(rgb)
+        samples.append((path, rgb, truth))
+    return samples
+
+
+def calibrate(samples, backends, scale=0.25, min_recall=0.95, repeat=3):
+    """
+    Measure each backend's speed and recall at the recognition detection scale
+
+    Returns:
+        (results, chosen) where results is a list of dicts and chosen is the
+        fastest backend whose recall is at least min_recall (None if none is)
+    """
+    small = [cv2.resize(rgb, (0, 0), fx=scale, fy=scale) if scale != 1 else rgb for _, rgb, _ in samples]
+    total = sum(len(truth) for _, _, truth in samples)
+    results = []
+    for name in backends:
+        detector = create_detector(name)
+        try:
+            detector.detect(small[0])  # load the model outside the timing
+        except Exception as e:
+            print(f"{name}: unavailable ({str(e)})")
+            continue
+
+        timings, hits = [], 0
+        for (path, rgb, truth), image in zip(samples, small):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                found = detector.detect(image)
+                timings.append(time.perf_counter() - start)
+            found = [tuple(int(round(c / scale)) for c in box) for box in found]
+            hits += count_hits(truth, found)
+        recall = hits / total if total else 1.0
+        results.append({'backend': name, 'median_ms': round(1000 * float(np.median(timings)), 3),
+                        'recall': round(recall, 4)})
+
+    eligible = [r for r in results if r['recall'] >= min_recall]
+    chosen = min(eligible, key=lambda r: r['median_ms']) if eligible else None
+    return results, chosen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face detector backends: measure speed and recall, "
+                                                 "and pick the fastest one that finds enough faces")
+    sub = parser.add_subparsers(dest='command')
+    cal = sub.add_parser('calibrate', help="time every backend on sample images and save the choice")
+    cal.add_argument('samples', nargs='+', help="sample frames (e.g. output_frames/*.jpg)")
+    cal.add_argument('--labels', help="JSON file of ground-truth boxes per image "
+                                      "(default: a slow reference HOG run)")
+    cal.add_argument('--recall', type=float, default=0.95, help="minimum recall for a backend to be chosen")
+    cal.add_argument('--scale', type=float, default=0.25, help="detection scale used by the recognizer")
+    cal.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    cal.add_argument('--repeat', type=int, default=3)
+    cal.add_argument('--output', default=CALIBRATION_FILE)
+    args = parser.parse_args()
+
+    if args.command != 'calibrate':
+        parser.print_help()
+        sys.exit(0)
+
+    samples = load_samples([p for p in args.samples if os.path.isfile(p)], args.labels)
+    if not samples:
+        print("No readable sample images")
+        sys.exit(1)
+    faces = sum(len(truth) for _, _, truth in samples)
+    print(f"Calibrating on {len(samples)} images with {faces} faces at scale {args.scale}")
+    results, chosen = calibrate(samples, args.backends, args.scale, args.recall, args.repeat)
+    for r in results:
+        print(f"{r['backend']:5s} {r['median_ms']:9.2f} ms/frame  recall {r['recall']:.1%}")
+    if chosen is None:
+        print(f"\nNo backend reached {args.recall:.0%} recall; keeping the current choice")
+        sys.exit(1)
+    with open(args.output, 'w') as f:
+        json.dump({**chosen, 'min_recall': args.recall, 'scale': args.scale, 'samples': len(samples),
+                   'faces': faces, 'results': results}, f, indent=2)
+    print(f"\nSelected {chosen['backend']}; saved to {args.output} (used by --detector auto)")
@@ -0,0 +1,415 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+
+# name is None when the nearest identity is further than the tolerance
+Match = namedtuple('Match', ['name', 'distance', 'margin'])
+
+ENCODING_SIZE = 128
+CHUNK_ROWS = 4096  # gallery rows scored per matrix product; the float32 copy of an int8 chunk stays in cache
+
+
+def quantize_rows(matrix):
+    """
+    Symmetric int8 quantization with one scale per row
+
+    Returns:
+        (codes, scales) with matrix ~= codes * scales[:, None]
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127 if len(matrix) else np.empty(0, dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1).astype(np.float32)
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+class FaceMatcher:
+    """
+    Nearest-identity matcher over the whole gallery
+
+    The gallery is kept as one contiguous float32 matrix with rows grouped by
+    identity, so all faces in a frame are scored against every known encoding
+    in a single matrix product. Each face gets the closest identity, its
+    distance and the margin to the runner-up identity.
+
+    Names are interned into `identities` and each row only stores an int32
+    label. With quantize=True the matrix holds int8 codes with one float32
+    scale per row (a quarter of the float32 size); faces are scored against
+    the codes directly, chunk by chunk, and the row scale is applied to the
+    dot products. `order` maps each row back to its position in `encodings`.
+    """
+
+    def __init__(self, encodings, names, tolerance=0.6, min_margin=0.0, quantize=False):
+        self.tolerance = tolerance
+        self.min_margin = min_margin
+        self.index = None
+        self.candidates = 32
+        self.prototypes = None
+
+        names = list(names)
+        self.identities = sorted(set(names))
+        index = {name: i for i, name in enumerate(self.identities)}
+        labels = np.array([index[name] for name in names], dtype=np.int32)
+
+        # Group rows by identity so per-identity minima are one reduceat call
+        order = np.argsort(labels, kind='stable')
+        self.order = order
+        self.labels = labels[order]
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)[order]
+        if quantize:
+            self.matrix, self.scales = quantize_rows(matrix)
+        else:
+            self.matrix, self.scales = np.ascontiguousarray(matrix), None
+        self._prepare()
+
+    @classmethod
+    def from_arrays(cls, matrix, labels, identities, tolerance=0.6, min_margin=0.0, scales=None,
+                    sq_norms=None):
+        """
+        Wrap an already grouped gallery without copying it
+
+        matrix, labels and scales must be laid out like the FaceMatcher
+        attributes (rows sorted by identity), e.g. views onto shared memory or
+        memory-mapped files.
+        """
+        matcher = cls.__new__(cls)
+        matcher.tolerance = tolerance
+        matcher.min_margin = min_margin
+        matcher.index = None
+        matcher.candidates = 32
+        matcher.prototypes = None
+        matcher.identities = list(identities)
+        matcher.order = None
+        matcher.labels = labels
+        matcher.matrix = matrix
+        matcher.scales = scales
+        matcher._prepare(sq_norms)
+        return matcher
+
+    def updated(self, keep, encodings, names, keys=None):
+        """
+        A new matcher with the rows in `keep` plus the given encodings, without redoing the kept rows
+
+        Kept rows are copied in their stored form (int8 codes are not
+        re-quantized) along with their squared norms; only the new rows are
+        converted. Rows stay grouped by identity and, when `keys` is given
+        (one per kept row, then one per new encoding), are ordered by it within
+        each identity. `order` maps each row to its position in that same
+        kept-then-new sequence.
+        """
+        keep = np.asarray(keep, dtype=np.int64)
+        names = list(names)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        kept_labels = self.labels[keep]
+        identities = sorted({self.identities[label] for label in np.unique(kept_labels)} | set(names))
+        index = {name: i for i, name in enumerate(identities)}
+        remap = np.array([index.get(name, -1) for name in self.identities], dtype=np.int32)
+        labels = np.concatenate([remap[kept_labels], np.array([index[name] for name in names], dtype=np.int32)])
+        keys = np.arange(len(labels)) if keys is None else np.asarray(keys)
+        order = np.lexsort((keys, labels))
+
+        if self.scales is not None:
+            codes, scales = quantize_rows(encodings)
+            new_rows = codes.astype(np.float32) * scales[:, None]
+            matrix = np.concatenate([self.matrix[keep], codes])[order]
+            scales = np.concatenate([self.scales[keep], scales])[order]
+        else:
+            new_rows = encodings
+            matrix = np.concatenate([np.asarray(self.matrix[keep], dtype=np.float32), encodings])[order]
+            scales = None
+        sq_norms = np.concatenate([self.sq_norms[keep], np.einsum('ij,ij->i', new_rows, new_rows)])[order]
+
+        matcher = FaceMatcher.from_arrays(matrix, labels[order], identities, self.tolerance, self.min_margin,
+                                          scales, sq_norms)
+        matcher.order = order
+        matcher.candidates = self.candidates
+        return matcher
+
+    def _prepare(self, sq_norms=None):
+        if sq_norms is None:
+            sq_norms = np.empty(len(self.matrix), dtype=np.float32)
+            for start in range(0, len(self.matrix), CHUNK_ROWS):
+                rows = self.rows(start, start + CHUNK_ROWS)
+                sq_norms[start:start + CHUNK_ROWS] = np.einsum('ij,ij->i', rows, rows)
+        self.sq_norms = sq_norms
+        self.group_starts = np.flatnonzero(np.r_[True, self.labels[1:] != self.labels[:-1]]) \
+            if len(self.labels) else np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def quantized(self):
+        return self.scales is not None
+
+    @property
+    def nbytes(self):
+        """Memory held by the gallery arrays and the identity table"""
+        arrays = (self.matrix, self.scales, self.labels, self.sq_norms, self.group_starts, self.order)
+        return (sum(a.nbytes for a in arrays if a is not None)
+                + sys.getsizeof(self.identities) + sum(sys.getsizeof(name) for name in self.identities))
+
+    def rows(self, start=0, stop=None):
+        """Gallery rows start:stop as float32 encodings (dequantized when the matrix is int8)"""
+        block = self.matrix[start:stop]
+        if self.scales is None:
+            return np.asarray(block, dtype=np.float32)
+        return block.astype(np.float32) * self.scales[start:stop, None]
+
+    def distances(self, face_encodings):
+        """Euclidean distances, shape (faces, gallery rows), in one batched computation"""
+        faces = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        face_sq = np.einsum('ij,ij->i', faces, faces)[:, None]
+        sq = np.empty((len(faces), len(self.matrix)), dtype=np.float32)
+        for start in range(0, len(self.matrix), CHUNK_ROWS):
+            stop = start + CHUNK_ROWS
+            block = self.matrix[start:stop]
+            if self.scales is None:
+                dots = faces @ block.T
+            else:
+                # Score against the int8 codes and apply each row's scale to the dot products
+                dots = faces @ block.T.astype(np.float32)
+                dots *= self.scales[start:stop]
+            sq[:, start:stop] = face_sq + self.sq_norms[start:stop] - 2.0 * dots
+        np.maximum(sq, 0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def identity_distances(self, face_encodings):
+        """Distance from each face to the closest encoding of every identity, shape (faces, identities)"""
+        return np.minimum.reduceat(self.distances(face_encodings), self.group_starts, axis=1)
+
+    def use_index(self, index, candidates=32):
+        """
+        Search through an approximate index (see ann_index.IVFIndex) instead of the full matrix
+
+        The index must be built over self.rows(). The runner-up identity is
+        taken from the top `candidates` neighbours, so the margin is infinite
+        when they all belong to the same person.
+        """
+        self.index = index
+        self.candidates = candidates
+
+    def use_prototypes(self, prototypes):
+        """
+        Match against per-person prototypes first (see gallery_condense.Prototypes)
+
+        A face is decided from the prototypes when the bounds they give are
+        conclusive: its best identity is within the tolerance (the exact
+        distance to that person's photos is computed) and no other identity
+        can be closer by min_margin, or every identity is certainly beyond the
+        tolerance. Only the remaining faces, near the threshold or between two
+        people, are scored against the full gallery, so names are the same as
+        without prototypes. For clearly unknown faces the distance is to the
+        closest identity by prototype rather than over the whole gallery.
+        """
+        self.prototypes = prototypes
+
+    def _match_prototypes(self, face_encodings):
+        faces = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        prototypes = self.prototypes
+        approx = prototypes.identity_distances(faces)
+        lower = approx - prototypes.radius
+
+        results = [None] * len(faces)
+        fallback = []
+        for i, face in enumerate(faces):
+            best = int(approx[i].argmin())
+            start = self.group_starts[best]
+            stop = self.group_starts[best + 1] if best + 1 < len(self.group_starts) else len(self)
+            rows = self.rows(start, stop)
+            sq = face @ face + self.sq_norms[start:stop] - 2.0 * rows @ face
+            dist = float(np.sqrt(max(sq.min(), 0)))
+            others = lower[i].copy()
+            others[best] = np.inf
+            second = float(others.min())
+
+            if dist <= self.tolerance and second - dist >= max(self.min_margin, 0):
+                results[i] = Match(self.identities[best], dist, second - dist)
+            elif lower[i].min() > self.tolerance:
+                results[i] = Match(None, dist, second - dist)
+            else:
+                fallback.append(i)
+
+        prototypes.matched += len(faces) - len(fallback)
+        prototypes.fallbacks += len(fallback)
+        if fallback:
+            for i, match in zip(fallback, self._match_exact(faces[fallback])):
+                results[i] = match
+        return results
+
+    def _accept(self, label, dist, second):
+        margin = float(second - dist)
+        accepted = dist <= self.tolerance and margin >= self.min_margin
+        return Match(self.identities[label] if accepted else None, float(dist), margin)
+
+    def _match_indexed(self, face_encodings):
+        distances, ids = self.index.search(face_encodings, k=self.candidates)
+        results = []
+        for row_dist, row_ids in zip(distances, ids):
+            if row_ids[0] < 0:
+                results.append(Match(None, float('inf'), float('inf')))
+                continue
+            labels = self.labels[row_ids[row_ids >= 0]]
+            others = np.flatnonzero(labels != labels[0])
+            second = row_dist[others[0]] if len(others) else np.inf
+            results.append(self._accept(labels[0], row_dist[0], second))
+        return results
+
+    def match(self, face_encodings):
+        """Return a Match for every face encoding"""
+        if len(face_encodings) == 0:
+            return []
+        if len(self.matrix) == 0:
+            return [Match(None, float('inf'), float('inf')) for _ in face_encodings]
+        if self.index is not None:
+            return self._match_indexed(face_encodings)
+        if self.prototypes is not None:
+            return self._match_prototypes(face_encodings)
+        return self._match_exact(face_encodings)
+
+    def _match_exact(self, face_encodings):
+        per_identity = self.identity_distances(face_encodings)
+        best = per_identity.argmin(axis=1)
+        best_dist = per_identity[np.arange(len(best)), best]
+        if per_identity.shape[1] > 1:
+            runner_up = np.partition(per_identity, 1, axis=1)[:, 1]
+        else:
+            runner_up = np.full(len(best), np.inf, dtype=per_identity.dtype)
+
+        return [self._accept(label, dist, second)
+                for label, dist, second in zip(best, best_dist, runner_up)]
+
+    def save(self, path):
+        """
+        Write the gallery as a directory of .npy files that load() can memory-map
+
+        Holds the matrix (float32 or int8 codes), the row scales, labels and
+        squared norms, and a JSON file with the identity table.
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = {'matrix': self.matrix, 'labels': self.labels, 'sq_norms': self.sq_norms}
+        if self.scales is not None:
+            arrays['scales'] = self.scales
+        for key, array in arrays.items():
+            np.save(os.path.join(path, f'{key}.npy'), np.ascontiguousarray(array))
+        tmp_path = os.path.join(path, 'gallery.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'identities': self.identities, 'rows': len(self), 'quantized': self.quantized}, f)
+        os.replace(tmp_path, os.path.join(path, 'gallery.json'))
+
+    @classmethod
+    def load(cls, path, tolerance=0.6, min_margin=0.0, mmap=True):
+        """Open a gallery written by save(); with mmap the arrays are paged in from disk on use"""
+        with open(os.path.join(path, 'gallery.json')) as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        arrays = {key: np.load(os.path.join(path, f'{key}.npy'), mmap_mode=mode)
+                  for key in ('matrix', 'labels', 'sq_norms')}
+        scales = np.load(os.path.join(path, 'scales.npy'), mmap_mode=mode) if meta['quantized'] else None
+        if len(arrays['matrix']) != meta['rows']:
+            raise ValueError(f"Gallery {path} is incomplete ({len(arrays['matrix'])} of {meta['rows']} rows)")
+        return cls.from_arrays(arrays['matrix'], np.asarray(arrays['labels']), meta['identities'],
+                               tolerance, min_margin, scales, arrays['sq_norms'])
+
+
+def baseline_bytes(encodings, names):
+    """Memory of the original representation: a list of float64 arrays and a list of name strings"""
+    # getsizeof counts the data only for arrays that own it
+    return (sys.getsizeof(encodings) + sum(sys.getsizeof(e) + (e.nbytes if e.base is not None else 0)
+                                           for e in encodings)
+            + sys.getsizeof(names) + sum(sys.getsizeof(n) for n in {id(n): n for n in names}.values()))
+
+
+def compare_formats(encodings, names, queries, truth, tolerance=0.6, directory=None):
+    """
+    Memory, speed and accuracy of the float32 and int8 galleries against a float64 baseline
+
+    The baseline is a plain float64 nearest-neighbour search. Agreement is
+    the share of queries given the same name as the baseline; accuracy is
+    the share given their true identity.
+    """
+    gallery = np.asarray(encodings, dtype=np.float64)
+    exact = queries.astype(np.float64)
+    start = time.perf_counter()
+    sq = (np.einsum('ij,ij->i', exact, exact)[:, None] + np.einsum('ij,ij->i', gallery, gallery)[None]
+          - 2.0 * exact @ gallery.T)
+    nearest = sq.argmin(axis=1)
+    best = np.sqrt(np.maximum(sq[np.arange(len(queries)), nearest], 0))
+    baseline_ms = 1000 * (time.perf_counter() - start) / len(queries)
+    baseline = [names[i] if d <= tolerance else None for i, d in zip(nearest, best)]
+
+    identities = len(set(names))
+    reports = [{'format': 'float64 list (baseline)', 'bytes': baseline_bytes(encodings, names),
+                'ms_per_query': round(baseline_ms, 4), 'agreement': 1.0,
+                'accuracy': float(np.mean([b == t for b, t in zip(baseline, truth)])),
+                'max_distance_error': 0.0}]
+    for label, quantize in (('float32', False), ('int8', True)):
+        matcher = FaceMatcher(encodings, names, tolerance=tolerance, quantize=quantize)
+        matcher.order = None
+        if directory:
+            path = os.path.join(directory, f'gallery_{label}')
+            matcher.save(path)
+            matcher = FaceMatcher.load(path, tolerance=tolerance)
+            label += ' (memory-mapped)'
+        start = time.perf_counter()
+        matches = matcher.match(queries)
+        elapsed = time.perf_counter() - start
+        reports.append({
+            'format': label,
+            'bytes': matcher.nbytes if not directory else
+            sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)),
+            'ms_per_query': round(1000 * elapsed / len(queries), 4),
+            'agreement': float(np.mean([m.name == b for m, b in zip(matches, baseline)])),
+            'accuracy': float(np.mean([m.name == t for m, t in zip(matches, truth)])),
+            'max_distance_error': float(np.max(np.abs([m.distance for m in matches] - best))),
+        })
+    for report in reports:
+        report['bytes_per_identity'] = round(report['bytes'] / max(1, identities), 1)
+    return reports
+
+
+if __name__ == "__main__":
+    # Imported here so the matcher itself does not depend on the gallery tooling
+    from ann_index import synthetic_gallery
+    from gallery_cache import GalleryCache
+
+    parser = argparse.ArgumentParser(description="Compare gallery storage formats: memory per identity "
+                                                 "and matching accuracy against float64")
+    parser.add_argument('--size', type=int, default=100000, help="synthetic gallery rows")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--cache', action='store_true',
+                        help="use the real encodings from the gallery cache instead of synthetic ones")
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--save', help="also write both galleries to this directory and match memory-mapped")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.cache:
+        entries = [e for e in GalleryCache().load().entries.values() if e['has_face']]
+        if not entries:
+            print("The gallery cache has no encodings; run the attendance system first")
+            sys.exit(1)
+        encodings = [e['encoding'] for e in entries]
+        names = [e['name'] for e in entries]
+        noise = 0.03
+    else:
+        vectors, labels = synthetic_gallery(args.size)
+        # Scale the synthetic clusters to face_recognition's distance range
+        encodings = list((vectors * 3).astype(np.float64))
+        names = [f"person_{l}" for l in labels]
+        noise = 0.02
+    picks = rng.integers(0, len(encodings), args.queries)
+    queries = (np.asarray(encodings, dtype=np.float64)[picks]
+               + rng.normal(0, noise, (args.queries, ENCODING_SIZE))).astype(np.float32)
+    truth = [names[i] for i in picks]
+
+    identities = len(set(names))
+    print(f"{len(encodings)} encodings of {identities} people, {args.queries} queries")
+    for r in compare_formats(encodings, names, queries, truth, args.tolerance, args.save):
+        print(f"{r['format']:26s} {r['bytes'] / 2**20:9.1f} MB  {r['bytes_per_identity']:8.0f} B/identity  "
+              f"{r['ms_per_query']:7.3f} ms/query  agreement {r['agreement']:.2%}  "
+              f"accuracy {r['accuracy']:.2%}  max distance error {r['max_distance_error']:.4f}")
@@ -0,0 +1,143 @@
+import itertools
+import time
+import cv2
+import numpy as np
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    inter = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    """A face followed across frames, with its identity cached after the first encoding"""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.name = None
+        self.distance = None
+        self.encoded = False
+        self.confident = False
+        self.missed = 0
+
+
+class FaceTracker:
+    """
+    Keeps face boxes alive between full detections
+
+    Full detection runs every detect_interval frames (or detect_period
+    seconds). Detections are associated with existing tracks by IoU; in the
+    frames between, boxes are moved with sparse optical flow. Identity is
+    stored per track, so on detection frames only new tracks, and tracks
+    whose match was unknown or within confidence_margin of the tolerance,
+    need a face encoding.
+    """
+
+    def __init__(self, detect_interval=5, detect_period=None, iou_threshold=0.3,
+                 max_missed=2, use_flow=True, confidence_margin=0.1):
+        self.detect_interval = max(1, detect_interval)
+        self.detect_period = detect_period
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.use_flow = use_flow
+        self.confidence_margin = confidence_margin
+        self.tracks = []
+        self.frames_since_detect = None
+        self.last_detect_time = 0.0
+        self.prev_gray = None
+        self._ids = itertools.count(1)
+
+    def detection_due(self):
+        if self.frames_since_detect is None or self.frames_since_detect + 1 >= self.detect_interval:
+            return True
+        return bool(self.detect_period) and time.monotonic() - self.last_detect_time >= self.detect_period
+
+    def update(self, boxes, gray=None):
+        """
+        Associate a fresh set of detections with the current tracks
+
+        Returns:
+            The new list of tracks; unmatched detections start new tracks and
+            tracks missed more than max_missed detections in a row are dropped
+        """
+        self.frames_since_detect = 0
+        self.last_detect_time = time.monotonic()
+        self.prev_gray = gray
+
+        pairs = sorted(((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks)
+                        for bi, b in enumerate(boxes)), reverse=True)
+        used_tracks, used_boxes = set(), set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in used_tracks or bi in used_boxes:
+                continue
+            used_tracks.add(ti)
+            used_boxes.add(bi)
+            self.tracks[ti].box = tuple(int(v) for v in boxes[bi])
+            self.tracks[ti].missed = 0
+
+        kept = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            kept.append(track)
+        for bi, box in enumerate(boxes):
+            if bi not in used_boxes:
+                kept.append(Track(next(self._ids), box))
+        self.tracks = kept
+        return self.tracks
+
+    def propagate(self, gray=None):
+        """Move the track boxes to the current frame without running the detector"""
+        self.frames_since_detect = (self.frames_since_detect or 0) + 1
+        if not self.use_flow or gray is None or self.prev_gray is None or not self.tracks:
+            self.prev_gray = gray
+            return self.tracks
+
+        height, width = gray.shape[:2]
+        for track in self.tracks:
+            top, right, bottom, left = track.box
+            mask = np.zeros_like(self.prev_gray)
+            mask[max(0, top):max(0, bottom), max(0, left):max(0, right)] = 255
+            points = cv2.goodFeaturesToTrack(self.prev_gray, maxCorners=20, qualityLevel=0.01,
+                                             minDistance=3, mask=mask)
+            if points is None:
+                continue
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, points, None)
+            good = status.reshape(-1) == 1
+            if good.sum() < 3:
+                continue
+            dx, dy = np.median((moved - points).reshape(-1, 2)[good], axis=0)
+            dx = int(round(float(np.clip(dx, -left, width - right))))
+            dy = int(round(float(np.clip(dy, -top, height - bottom))))
+            track.box = (top + dy, right + dx, bottom + dy, left + dx)
+
+        self.prev_gray = gray
+        return self.tracks
+
+    def to_encode(self):
+        """Tracks that need a (new) face encoding: never encoded, unknown or low confidence"""
+        return [t for t in self.tracks if t.missed == 0 and not (t.encoded and t.confident)]
+
+    def assign(self, track, match, tolerance):
+        """Cache the match result on a track"""
+        track.encoded = True
+        track.name = match.name
+        track.distance = match.distance
+        track.confident = (match.name is not None
+                           and match.distance <= tolerance - self.confidence_margin)
+
+    def visible(self):
+        """Tracks seen by the most recent detection"""
+        return [t for t in self.tracks if t.missed == 0]
@@ -0,0 +1,310 @@
+import contextlib
+import hashlib
+import os
+import stat
+import sys
+import tempfile
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+ENCODING_SIZE = 128
+
+# Reading the umask means setting it; done once here rather than from a thread in save()
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def default_cache_path(images_dir):
+    """Cache file stored next to the images directory (known_faces -> known_faces_cache.npz)"""
+    images_dir = os.path.normpath(os.path.abspath(images_dir))
+    parent, base = os.path.split(images_dir)
+    return os.path.join(parent, f"{base}_cache.npz")
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path + '.lock' across processes (released if the holder dies)"""
+    with open(path + '.lock', 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of a file's contents, read in chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class GalleryCache:
+    """
+    On-disk cache of face encodings for the photos in known_faces/
+
+    Each entry is keyed by the photo's path and validated against its size,
+    mtime and content hash, so only new or changed photos need re-encoding.
+    Photos without a detectable face are cached too (has_face=False) so they
+    are not re-detected on every startup.
+
+    The enrollment tool and a running system can both update the file, so
+    save() re-reads it under a lock file and applies only this instance's
+    own changes on top.
+    """
+
+    def __init__(self, images_dir='known_faces', cache_path=None):
+        self.images_dir = images_dir
+        self.cache_path = cache_path or default_cache_path(images_dir)
+        self.entries = {}
+        self.changed = set()
+        self.removed = set()
+        self.dirty = False
+
+    @staticmethod
+    def _key(path):
+        return os.path.normpath(path)
+
+    def load(self):
+        """Load entries from the cache file, starting empty if it is missing or unreadable"""
+        self.changed = set()
+        self.removed = set()
+        self.dirty = False
+        try:
+            self.entries = self._read()
+        except Exception as e:
+            print(f"Ignoring unreadable gallery cache {self.cache_path}: {str(e)}")
+            self.entries = {}
+            self.dirty = True
+        return self
+
+    def _read(self):
+        """Entries currently in the cache file ({} if there is none)"""
+        entries = {}
+        if not os.path.exists(self.cache_path):
+            return entries
+        # Each data[key] reads and decodes the whole array again, so read every array once
+        with np.load(self.cache_path, allow_pickle=False) as data:
+            paths, names, sizes, mtimes, digests, has_face, encodings = (
+                data[k] for k in ('paths', 'names', 'sizes', 'mtimes', 'digests', 'has_face', 'encodings'))
+        encodings = encodings.astype(np.float64, copy=False)
+        for i, path in enumerate(paths):
+            entries[str(path)] = {
+                'name': str(names[i]),
+                'size': int(sizes[i]),
+                'mtime_ns': int(mtimes[i]),
+                'digest': str(digests[i]),
+                'has_face': bool(has_face[i]),
+                'encoding': encodings[i].copy(),
+            }
+        return entries
+
+    def save(self):
+        """
+        Merge this instance's changes into the cache file and write it atomically
+
+        Under a lock file shared with other processes, the file is re-read so
+        entries saved since load() are kept, then written to a unique temp
+        file (given the cache file's permissions) and renamed.
+        """
+        with file_lock(self.cache_path):
+            try:
+                entries = self._read()
+            except Exception:
+                entries = {}
+            for path in self.removed:
+                entries.pop(path, None)
+            for path in self.changed:
+                entries[path] = self.entries[path]
+            self.entries = entries
+            self._write(entries)
+        self.changed = set()
+        self.removed = set()
+        self.dirty = False
+
+    def _write(self, entries):
+        paths = sorted(entries)
+        encodings = np.zeros((len(paths), ENCODING_SIZE), dtype=np.float64)
+        for i, path in enumerate(paths):
+            if entries[path]['has_face']:
+                encodings[i] = entries[path]['encoding']
+
+        try:
+            mode = stat.S_IMODE(os.stat(self.cache_path).st_mode)
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        directory, base = os.path.split(self.cache_path)
+        fd, tmp_path = tempfile.mkstemp(prefix=base + '.', suffix='.tmp', dir=directory or '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f,
+                         paths=np.array(paths, dtype=str),
+                         names=np.array([entries[p]['name'] for p in paths], dtype=str),
+                         sizes=np.array([entries[p]['size'] for p in paths], dtype=np.int64),
+                         mtimes=np.array([entries[p]['mtime_ns'] for p in paths], dtype=np.int64),
+                         digests=np.array([entries[p]['digest'] for p in paths], dtype=str),
+                         has_face=np.array([entries[p]['has_face'] for p in paths], dtype=bool),
+                         encodings=encodings)
+            # mkstemp creates the file readable by its owner only
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def lookup(self, path, name):
+        """
+        Return (has_face, encoding) for a cached photo, or None if it must be re-encoded
+
+        Size and mtime are checked first; the content hash is only computed when
+        they differ, so a touched-but-unchanged photo is still a cache hit.
+        """
+        entry = self.entries.get(self._key(path))
+        if entry is None or entry['name'] != name:
+            return None
+
+        stat = os.stat(path)
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['has_face'], entry['encoding']
+
+        if entry['size'] != stat.st_size or file_digest(path) != entry['digest']:
+            return None
+
+        entry['mtime_ns'] = stat.st_mtime_ns
+        self.changed.add(self._key(path))
+        self.dirty = True
+        return entry['has_face'], entry['encoding']
+
+    def put(self, path, name, encoding, digest=None):
+        """Store the encoding (or None when no face was found) for a photo"""
+        stat = os.stat(path)
+        key = self._key(path)
+        self.changed.add(key)
+        self.removed.discard(key)
+        self.entries[key] = {
+            'name': name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'digest': digest or file_digest(path),
+            'has_face': encoding is not None,
+            'encoding': None if encoding is None else np.asarray(encoding, dtype=np.float64),
+        }
+        self.dirty = True
+
+    def remove(self, path):
+        key = self._key(path)
+        if self.entries.pop(key, None) is not None:
+            self.changed.discard(key)
+            self.removed.add(key)
+            self.dirty = True
+
+    def prune(self, paths):
+        """Drop entries for photos that no longer exist; returns the number dropped"""
+        keep = {self._key(p) for p in paths}
+        stale = [p for p in self.entries if p not in keep]
+        for path in stale:
+            del self.entries[path]
+            self.changed.discard(path)
+            self.removed.add(path)
+        if stale:
+            self.dirty = True
+        return len(stale)
+
+    def verify(self, images):
+        """
+        Check every cached entry against the files on disk
+
+        Args:
+            images: list of (image_path, name) pairs currently in the images directory
+
+        Returns:
+            dict with lists of 'ok', 'changed', 'missing' and 'uncached' paths
+        """
+        report = {'ok': [], 'changed': [], 'missing': [], 'uncached': []}
+        current = {self._key(p): name for p, name in images}
+
+        for path, entry in sorted(self.entries.items()):
+            if path not in current:
+                report['missing'].append(path)
+                continue
+            stat = os.stat(path)
+            if (entry['name'] != current[path] or entry['size'] != stat.st_size
+                    or file_digest(path) != entry['digest']):
+                report['changed'].append(path)
+            else:
+                report['ok'].append(path)
+
+        report['uncached'] = sorted(p for p in current if p not in self.entries)
+        return report
+
+
+def rebuild_cache(images_dir='known_faces', cache_path=None):
+    """Re-encode every photo in the images directory and rewrite the cache from scratch"""
+    from attendance_system import list_face_images, encode_face_image
+
+    # Every existing entry is dropped, so the merge on save keeps only the fresh encodings
+    cache = GalleryCache(images_dir, cache_path).load()
+    cache.prune([])
+    images = list_face_images(images_dir)
+    print(f"Rebuilding gallery cache for {len(images)} photos...")
+    for image_path, name in images:
+        try:
+            encoding = encode_face_image(image_path)
+            if encoding is None:
+                print(f"No face found in {image_path}")
+            cache.put(image_path, name, encoding)
+        except Exception as e:
+            print(f"Error processing {image_path}: {str(e)}")
+    cache.save()
+    faces = sum(1 for e in cache.entries.values() if e['has_face'])
+    print(f"Wrote {cache.cache_path} ({faces} encodings, {len(cache.entries) - faces} photos without a face)")
+    return cache
+
+
+def verify_cache(images_dir='known_faces', cache_path=None):
+    """Print a consistency report for the cache; returns True when it matches the images directory"""
+    from attendance_system import list_face_images
+
+    cache = GalleryCache(images_dir, cache_path).load()
+    if not os.path.exists(cache.cache_path):
+        print(f"No gallery cache found at {cache.cache_path}")
+        return False
+
+    report = cache.verify(list_face_images(images_dir))
+    print(f"Gallery cache: {cache.cache_path}")
+    print(f"Up to date: {len(report['ok'])}")
+    for label in ('changed', 'missing', 'uncached'):
+        print(f"{label.capitalize()}: {len(report[label])}")
+        for path in report[label]:
+            print(f"  {path}")
+    return not (report['changed'] or report['missing'] or report['uncached'])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('rebuild', 'verify'):
+        print("Usage: python gallery_cache.py rebuild|verify [images_dir]")
+        sys.exit(2)
+
+    images_dir = sys.argv[2] if len(sys.argv) > 2 else 'known_faces'
+    if sys.argv[1] == 'rebuild':
+        rebuild_cache(images_dir)
+    else:
+        sys.exit(0 if verify_cache(images_dir) else 1)
@@ -0,0 +1,254 @@
+import argparse
+import sys
+import time
+import numpy as np
+
+from face_matcher import FaceMatcher, CHUNK_ROWS
+
+FLAG_DISTANCE = 0.5  # enrollment photos further than this from their person's centroid are reported
+
+
+class Prototypes:
+    """
+    A few representative encodings per person, used to match before the full gallery
+
+    Each person gets the centroid of their encodings; while some encoding is
+    further than `spread` from every prototype, the furthest one is added as
+    an outlier medoid (up to max_per_person). radius[k] is the largest
+    distance from any of person k's encodings to their nearest prototype, so
+    by the triangle inequality the distance from a face to person k's full
+    set lies within prototype distance +- radius[k]. FaceMatcher uses those
+    bounds to decide most faces from the prototypes alone and falls back to
+    the full gallery only when they straddle the tolerance or the runner-up.
+    """
+
+    def __init__(self, vectors, labels, radius, max_per_person=4, spread=0.2):
+        self.max_per_person = max_per_person
+        self.spread = spread
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.labels = labels
+        self.radius = radius
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.group_starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) \
+            if len(labels) else np.empty(0, dtype=np.int64)
+        self.matched = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def build(cls, matcher, max_per_person=4, spread=0.2):
+        """Condense a FaceMatcher's gallery (rows grouped by identity) into prototypes"""
+        n_people = len(matcher.identities)
+        if not len(matcher):
+            return cls(np.empty((0, matcher.matrix.shape[1]), dtype=np.float32),
+                       np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), max_per_person, spread)
+
+        starts = matcher.group_starts
+        counts = np.diff(np.r_[starts, len(matcher)])
+        centroids = np.zeros((n_people, matcher.matrix.shape[1]), dtype=np.float32)
+        to_centroid = np.empty(len(matcher), dtype=np.float32)
+        for start in range(0, len(matcher), CHUNK_ROWS):
+            rows = matcher.rows(start, start + CHUNK_ROWS)
+            np.add.at(centroids, matcher.labels[start:start + CHUNK_ROWS], rows)
+        centroids /= counts[:, None]
+        for start in range(0, len(matcher), CHUNK_ROWS):
+            rows = matcher.rows(start, start + CHUNK_ROWS)
+            to_centroid[start:start + len(rows)] = np.linalg.norm(
+                rows - centroids[matcher.labels[start:start + CHUNK_ROWS]], axis=1)
+        radius = np.maximum.reduceat(to_centroid, starts)
+
+        # Only people with a spread-out enrollment need more than their centroid
+        extra = {}
+        for label in np.flatnonzero(radius > spread):
+            start, count = starts[label], counts[label]
+            medoids, radius[label] = _medoids(matcher.rows(start, start + count),
+                                              to_centroid[start:start + count].copy(), max_per_person, spread)
+            if medoids:
+                extra[label] = medoids
+
+        vectors, labels = [], []
+        for label in range(n_people):
+            vectors.append(centroids[label])
+            labels.append(label)
+            for medoid in extra.get(label, ()):
+                vectors.append(medoid)
+                labels.append(label)
+        return cls(np.array(vectors), np.array(labels, dtype=np.int32), radius.astype(np.float32),
+                   max_per_person, spread)
+
+    def updated(self, old_identities, matcher, changed):
+        """
+        Prototypes for an updated gallery, recomputing only the people whose photos changed
+
+        old_identities is the identity table these prototypes were built for;
+        `changed` holds the names with added or removed rows. Everyone else
+        keeps their prototypes and radius as they are.
+        """
+        index = {name: i for i, name in enumerate(matcher.identities)}
+        remap = np.array([-1 if name in changed else index.get(name, -1) for name in old_identities],
+                         dtype=np.int32)
+        kept = remap[self.labels] >= 0 if len(self.labels) else np.zeros(0, dtype=bool)
+        vectors, labels = [self.vectors[kept]], [remap[self.labels[kept]]]
+        radius = np.zeros(len(matcher.identities), dtype=np.float32)
+        kept_people = np.flatnonzero(remap >= 0)
+        radius[remap[kept_people]] = self.radius[kept_people]
+
+        starts = np.r_[matcher.group_starts, len(matcher)]
+        for name in changed:
+            label = index.get(name)
+            if label is None:
+                continue
+            rows = matcher.rows(starts[label], starts[label + 1])
+            centroid = rows.mean(axis=0)
+            medoids, radius[label] = _medoids(rows, np.linalg.norm(rows - centroid, axis=1),
+                                              self.max_per_person, self.spread)
+            vectors.append(np.array([centroid] + medoids, dtype=np.float32))
+            labels.append(np.full(1 + len(medoids), label, dtype=np.int32))
+
+        vectors = np.concatenate(vectors).reshape(-1, self.vectors.shape[1])
+        labels = np.concatenate(labels)
+        # Stable, so each person's centroid stays first in their group
+        order = np.argsort(labels, kind='stable')
+        prototypes = Prototypes(vectors[order], labels[order], radius, self.max_per_person, self.spread)
+        prototypes.matched, prototypes.fallbacks = self.matched, self.fallbacks
+        return prototypes
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def identity_distances(self, faces):
+        """Distance from each face to the closest prototype of every identity, shape (faces, identities)"""
+        sq = (np.einsum('ij,ij->i', faces, faces)[:, None] + self.sq_norms[None, :]
+              - 2.0 * faces @ self.vectors.T)
+        np.maximum(sq, 0, out=sq)
+        return np.minimum.reduceat(np.sqrt(sq, out=sq), self.group_starts, axis=1)
+
+    def centroids(self):
+        """The centroid prototype of every identity (the first prototype of each group)"""
+        return self.vectors[self.group_starts]
+
+
+def _medoids(rows, nearest, max_per_person, spread):
+    """
+    Outlier medoids for one person, given each row's distance to the centroid
+
+    Returns:
+        (medoids, radius): the added rows and the largest remaining distance
+        from any row to its nearest prototype
+    """
+    medoids = []
+    while nearest.max() > spread and len(medoids) + 1 < max_per_person:
+        far = int(nearest.argmax())
+        medoids.append(rows[far])
+        np.minimum(nearest, np.linalg.norm(rows - rows[far], axis=1), out=nearest)
+    return medoids, float(nearest.max())
+
+
+def inconsistent_photos(matcher, prototypes, threshold=FLAG_DISTANCE):
+    """
+    Gallery rows that look unlike the rest of their person's photos
+
+    Returns:
+        List of (row, distance to own centroid, nearest other identity or None,
+        distance to it), furthest first
+    """
+    centroids = prototypes.centroids()
+    flagged = []
+    for start in range(0, len(matcher), CHUNK_ROWS):
+        rows = matcher.rows(start, start + CHUNK_ROWS)
+        labels = matcher.labels[start:start + CHUNK_ROWS]
+        own = np.linalg.norm(rows - centroids[labels], axis=1)
+        for i in np.flatnonzero(own > threshold):
+            d = np.linalg.norm(centroids - rows[i], axis=1)
+            d[labels[i]] = np.inf
+            other = int(d.argmin()) if len(d) > 1 else None
+            flagged.append((start + int(i), float(own[i]),
+                            matcher.identities[other] if other is not None else None,
+                            float(d[other]) if other is not None else float('inf')))
+    return sorted(flagged, key=lambda f: -f[1])
+
+
+def evaluate(matcher, queries):
+    """
+    Prototype-first matching against the full scan on the same queries
+
+    Returns:
+        dict with agreement, fallback rate, comparisons per face and timings
+    """
+    prototypes = matcher.prototypes
+    matcher.prototypes = None
+    start = time.perf_counter()
+    full = matcher.match(queries)
+    full_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+    matcher.prototypes = prototypes
+    prototypes.matched = prototypes.fallbacks = 0
+    start = time.perf_counter()
+    condensed = matcher.match(queries)
+    condensed_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+    counts = np.diff(np.r_[matcher.group_starts, len(matcher)])
+    direct = [counts[matcher.identities.index(m.name)] for m in condensed if m.name is not None]
+    comparisons = len(prototypes) + (sum(direct) + prototypes.fallbacks * len(matcher)) / len(queries)
+    return {
+        'agreement': float(np.mean([a.name == b.name for a, b in zip(full, condensed)])),
+        'fallback_rate': prototypes.fallbacks / len(queries),
+        'comparisons_full': len(matcher),
+        'comparisons_condensed': round(comparisons, 1),
+        'full_ms': round(full_ms, 4),
+        'condensed_ms': round(condensed_ms, 4),
+    }
+
+
+if __name__ == "__main__":
+    # Imported here so the module itself does not depend on the gallery tooling
+    from ann_index import synthetic_gallery
+    from gallery_cache import GalleryCache
+
+    parser = argparse.ArgumentParser(description="Condense the gallery into per-person prototypes, "
+                                                 "flag inconsistent enrollment photos and check accuracy")
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="use a synthetic gallery of this many photos instead of the gallery cache")
+    parser.add_argument('--max-prototypes', type=int, default=4, help="prototypes per person")
+    parser.add_argument('--spread', type=float, default=0.2,
+                        help="add outlier medoids until every photo is this close to a prototype")
+    parser.add_argument('--flag', type=float, default=FLAG_DISTANCE,
+                        help="report photos further than this from their person's centroid")
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors, labels = synthetic_gallery(args.synthetic, args.synthetic // 10, noise=0.025)
+        encodings, names, paths = vectors * 0.5, [f"person_{l}" for l in labels], None
+    else:
+        entries = [(path, e) for path, e in sorted(GalleryCache().load().entries.items()) if e['has_face']]
+        if not entries:
+            print("The gallery cache has no encodings; run the attendance system first")
+            sys.exit(1)
+        paths = [path for path, _ in entries]
+        encodings = [e['encoding'] for _, e in entries]
+        names = [e['name'] for _, e in entries]
+
+    matcher = FaceMatcher(encodings, names, tolerance=args.tolerance)
+    start = time.perf_counter()
+    matcher.use_prototypes(Prototypes.build(matcher, args.max_prototypes, args.spread))
+    print(f"{len(matcher)} photos of {len(matcher.identities)} people condensed to "
+          f"{len(matcher.prototypes)} prototypes in {1000 * (time.perf_counter() - start):.0f} ms")
+
+    flagged = inconsistent_photos(matcher, matcher.prototypes, args.flag)
+    print(f"\n{len(flagged)} photos further than {args.flag} from their person's centroid")
+    for row, own, other, other_distance in flagged[:20]:
+        photo = paths[matcher.order[row]] if paths else f"row {row}"
+        closer = f", closer to {other} ({other_distance:.2f})" if other_distance < own else ""
+        print(f"  {matcher.identities[matcher.labels[row]]}: {photo} ({own:.2f}{closer})")
+
+    # Queries: gallery photos with noise, so most are near their own person and a few near the threshold
+    rng = np.random.default_rng(1)
+    gallery = matcher.rows()
+    picks = rng.integers(0, len(gallery), args.queries)
+    queries = gallery[picks] + rng.normal(0, 0.03, (args.queries, gallery.shape[1])).astype(np.float32)
+    report = evaluate(matcher, queries)
+    print(f"\nAgreement with the full scan: {report['agreement']:.2%}, "
+          f"fallback to the full gallery for {report['fallback_rate']:.1%} of faces")
+    print(f"Comparisons per face: {report['comparisons_condensed']:.0f} instead of {report['comparisons_full']} "
+          f"({report['condensed_ms']:.3f} ms instead of {report['full_ms']:.3f} ms per face)")
@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from attendance_system import list_face_images, stat_images, _encode_worker
+from ann_index import IVFIndex, fingerprint
+from gallery_condense import Prototypes
+from gallery_cache import GalleryCache
+
+
+class GalleryWatcher:
+    """
+    Polls known_faces/ and applies added, changed and deleted photos to a running system
+
+    New photos are encoded in a separate process so the recognition loop
+    does not compete for the interpreter lock. A photo is only picked up once
+    its size and mtime are unchanged between two polls, so half-written files
+    are skipped. The updated gallery is built off to the side and swapped in
+    with a single attribute assignment; recognize() reads system.matcher once
+    per frame, so each frame sees either the old or the new gallery.
+    """
+
+    def __init__(self, system, interval=5.0):
+        self.system = system
+        self.interval = interval
+        # Taken from the loader's own listing on the first poll (see poll)
+        self.known = None
+        self.pending = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.executor = None
+
+    def _snapshot(self):
+        """{image_path: (name, size, mtime_ns)} for every photo currently in the directory"""
+        try:
+            return stat_images(list_face_images(self.system.images_dir))
+        except OSError:
+            return {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, name='gallery-watcher', daemon=True)
+        self.thread.start()
+        print(f"Watching {self.system.images_dir} for new photos every {self.interval:g}s")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.interval + 5)
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _loop(self):
+        # The first poll would race the background loader for the known_face_* lists
+        while not self.system.gallery_ready.wait(self.interval):
+            if self.stop_event.is_set():
+                return
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error updating gallery: {str(e)}")
+
+    def poll(self):
+        """Check the directory once; returns (added_or_changed, removed) paths that were applied"""
+        if self.known is None:
+            # Start from exactly what the gallery was loaded from, so photos added or deleted
+            # while it loaded (or while the camera opened) are picked up like any other change
+            snapshot = self.system.gallery_snapshot
+            self.known = dict(snapshot) if snapshot is not None else self._snapshot()
+        current = self._snapshot()
+        removed = [p for p in self.known if p not in current]
+        changed = [p for p, state in current.items() if self.known.get(p) != state]
+
+        # Wait for a second identical stat before reading a new or modified file
+        ready = [p for p in changed if self.pending.get(p) == current[p]]
+        self.pending = {p: current[p] for p in changed if p not in ready}
+        if not ready and not removed:
+            return [], []
+
+        encodings = self._encode(ready, current)
+        self._apply(encodings, set(ready) | set(removed), current)
+
+        # Only once the new gallery is live, so a failed update is retried on the next polls
+        for path in ready:
+            self.known[path] = current[path]
+        for path in removed:
+            del self.known[path]
+        return ready, removed
+
+    def _encode(self, paths, current):
+        """Encodings for the given photos (None for no face), using the gallery cache where possible"""
+        cache = GalleryCache(self.system.images_dir).load() if self.system.use_cache else None
+        encodings = {}
+        to_encode = []
+        for path in paths:
+            name = current[path][0]
+            hit = cache.lookup(path, name) if cache else None
+            if hit is not None:
+                has_face, encoding = hit
+                encodings[path] = (name, encoding if has_face else None)
+            else:
+                to_encode.append(path)
+
+        if to_encode:
+            if self.executor is None:
+                # Forking this multithreaded process (camera and recognition threads) can deadlock the child
+                self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            for path, encoding, error in self.executor.map(_encode_worker, to_encode):
+                name = current[path][0]
+                if error:
+                    print(f"Error loading {path}: {error}")
+                    continue
+                if encoding is None:
+                    print(f"No face found in {path}")
+                if cache:
+                    cache.put(path, name, encoding)
+                encodings[path] = (name, encoding)
+
+        if cache:
+            cache.prune(current)
+            if cache.dirty:
+                cache.save()
+        return encodings
+
+    def _apply(self, encodings, replaced, current):
+        """
+        Update the gallery in place of the affected rows and swap it into the running system
+
+        Only the removed and added rows are touched: the matcher keeps the
+        other rows as stored, the IVF index files the new encodings under its
+        existing centroids (and is saved again), and prototypes are recomputed
+        only for the people whose photos changed. Within each person, rows are
+        ordered as the photos are listed, which is the order a fresh start
+        builds, so the saved index still matches after a restart.
+        """
+        system = self.system
+        old_matcher = system.matcher
+
+        keep = np.array([i for i, path in enumerate(system.known_face_paths) if path not in replaced],
+                        dtype=np.int64)
+        paths = [system.known_face_paths[i] for i in keep]
+        new_paths, names, new_encodings = [], [], []
+        for path, (name, encoding) in encodings.items():
+            if encoding is not None:
+                new_paths.append(path)
+                names.append(name)
+                new_encodings.append(encoding)
+                print(f"Loaded: {name} from {os.path.basename(path)}")
+        paths += new_paths
+        rank = {path: i for i, path in enumerate(current)}
+
+        start = time.perf_counter()
+        matcher = old_matcher.updated(keep, new_encodings, names, [rank.get(p, len(rank)) for p in paths])
+        # New row of each kept old row (-1 for removed ones) and of each added encoding
+        position = np.empty(len(matcher), dtype=np.int64)
+        position[matcher.order] = np.arange(len(matcher))
+        mapping = np.full(len(old_matcher), -1, dtype=np.int64)
+        mapping[keep] = position[:len(keep)]
+        added = position[len(keep):]
+
+        if system.ann_probe:
+            if not len(matcher):
+                index = None
+            elif old_matcher.index is not None:
+                vectors = np.array([matcher.rows(i, i + 1)[0] for i in added],
+                                   dtype=np.float32).reshape(-1, matcher.matrix.shape[1])
+                index = old_matcher.index.updated(mapping, vectors, added, fingerprint(matcher.rows()))
+            else:
+                # The first photos of a gallery that started empty
+                index = IVFIndex(n_probe=system.ann_probe).build(matcher.rows())
+            if index is not None:
+                matcher.use_index(index, old_matcher.candidates)
+                index.save(system.ann_index_path())
+        elif system.condense:
+            changed = {old_matcher.identities[label] for label in old_matcher.labels[mapping < 0]} | set(names)
+            if old_matcher.prototypes is not None:
+                prototypes = old_matcher.prototypes.updated(old_matcher.identities, matcher, changed)
+            else:
+                prototypes = Prototypes.build(matcher)
+            matcher.use_prototypes(prototypes)
+
+        system.known_face_paths = [paths[i] for i in matcher.order]
+        system.matcher = matcher
+
+        system.metrics.gauge('gallery_encodings', len(matcher))
+        system.metrics.gauge('gallery_people', len(matcher.identities))
+        system.metrics.gauge('gallery_bytes', matcher.nbytes)
+        if matcher.prototypes is not None:
+            system.metrics.gauge('gallery_prototypes', len(matcher.prototypes))
+        print(f"Gallery updated: {len(matcher)} faces, {len(matcher.identities)} people "
+              f"(updated in {1000 * (time.perf_counter() - start):.0f} ms)")
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RollingHistogram:
+    """Keeps the last `size` samples in a preallocated ring buffer for percentile queries"""
+
+    def __init__(self, size=2048):
+        self.samples = np.zeros(size, dtype=np.float64)
+        self.next = 0
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value):
+        self.samples[self.next] = value
+        self.next = (self.next + 1) % len(self.samples)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        filled = min(self.count, len(self.samples))
+        if not filled:
+            return [None] * len(quantiles)
+        return [float(v) for v in np.quantile(self.samples[:filled], quantiles)]
+
+
+class Metrics:
+    """
+    Per-stage latency histograms and event counters for the recognition loop
+
+    Timings are recorded with time.perf_counter into fixed-size ring buffers,
+    so the cost on the hot path is a couple of array writes. Values can be
+    read as a dict, as Prometheus text, over a localhost HTTP endpoint, or
+    dumped periodically to a JSON file.
+    """
+
+    def __init__(self, window=2048):
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+        self.server = None
+        self.dump_thread = None
+        self.stop_event = threading.Event()
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = RollingHistogram(self.window)
+            histogram.record(seconds)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """Current values as a JSON-serialisable dict (latencies in milliseconds)"""
+        with self.lock:
+            stages = {}
+            for stage, histogram in self.histograms.items():
+                p50, p95, p99 = histogram.quantiles()
+                stages[stage] = {
+                    'count': histogram.count,
+                    'mean_ms': 1000 * histogram.total / histogram.count if histogram.count else None,
+                    'p50_ms': None if p50 is None else 1000 * p50,
+                    'p95_ms': None if p95 is None else 1000 * p95,
+                    'p99_ms': None if p99 is None else 1000 * p99,
+                }
+            return {
+                'timestamp': time.time(),
+                'uptime_seconds': time.time() - self.started,
+                'stages': stages,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def prometheus(self, prefix='attendance'):
+        """Prometheus text exposition format"""
+        lines = [f"# HELP {prefix}_stage_latency_seconds Recognition stage latency over the recent window",
+                 f"# TYPE {prefix}_stage_latency_seconds summary"]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                for q, value in zip(QUANTILES, histogram.quantiles()):
+                    if value is not None:
+                        lines.append(f'{prefix}_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{prefix}_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'{prefix}_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """Serve /metrics (Prometheus) and /metrics.json on a background thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        print(f"Metrics available at http://{host}:{self.server.server_port}/metrics")
+        return self.server.server_port
+
+    def dump_periodically(self, path, interval=10.0):
+        """Write a JSON snapshot to path every interval seconds (atomic replace)"""
+        def loop():
+            while not self.stop_event.wait(interval):
+                self.dump(path)
+
+        self.dump_thread = threading.Thread(target=loop, name='metrics-dump', daemon=True)
+        self.dump_thread.start()
+
+    def dump(self, path):
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing metrics to {path}: {str(e)}")
+
+    def close(self):
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
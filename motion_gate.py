@@ -0,0 +1,56 @@
+import threading
+import time
+import cv2
+
+
+class MotionGate:
+    """
+    Cheap change detector that decides whether a frame needs face detection
+
+    Each frame is reduced to a small blurred greyscale thumbnail and compared
+    with the thumbnail of the last frame that was detected on. If fewer than
+    `threshold` (a fraction of the thumbnail) pixels changed by more than
+    `pixel_delta` grey levels, detection can be skipped and the previous
+    results reused. Comparing against the last detected frame rather than
+    the previous frame means slow changes still add up and trigger detection.
+    A detection is forced every force_interval seconds regardless.
+    """
+
+    def __init__(self, threshold=0.01, pixel_delta=25, force_interval=2.0, size=(80, 60)):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.force_interval = force_interval
+        self.size = size
+        self.reference = None
+        self.last_detect = 0.0
+        self.checked = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def thumbnail(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_fraction(self, thumbnail):
+        """Fraction of thumbnail pixels that differ from the reference by more than pixel_delta"""
+        diff = cv2.absdiff(thumbnail, self.reference)
+        return cv2.countNonZero(cv2.threshold(diff, self.pixel_delta, 255, cv2.THRESH_BINARY)[1]) / diff.size
+
+    def should_detect(self, frame):
+        """True if the frame changed enough (or a forced detection is due); False to skip it"""
+        thumbnail = self.thumbnail(frame)
+        now = time.monotonic()
+        with self.lock:
+            self.checked += 1
+            if (self.reference is None or now - self.last_detect >= self.force_interval
+                    or self.changed_fraction(thumbnail) > self.threshold):
+                self.reference = thumbnail
+                self.last_detect = now
+                return True
+            self.skipped += 1
+            return False
+
+    @property
+    def skipped_ratio(self):
+        return self.skipped / self.checked if self.checked else 0.0
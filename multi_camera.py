@@ -0,0 +1,224 @@
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+from attendance_system import AttendanceSystem, identify_faces
+from face_matcher import FaceMatcher
+from gallery_condense import Prototypes
+
+
+class SharedGallery:
+    """
+    The matcher's gallery matrix and identity labels placed in shared memory
+
+    Camera workers attach to the same block instead of each holding (and
+    encoding) their own copy of the gallery.
+    """
+
+    def __init__(self, matcher):
+        self.blocks = []
+        self.spec = {
+            'identities': list(matcher.identities),
+            'tolerance': matcher.tolerance,
+            'min_margin': matcher.min_margin,
+            'matrix': self._share(matcher.matrix),
+            'labels': self._share(matcher.labels),
+            'sq_norms': self._share(matcher.sq_norms),
+            'condense': matcher.prototypes is not None,
+        }
+        if matcher.scales is not None:
+            self.spec['scales'] = self._share(matcher.scales)
+
+    def _share(self, array):
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        self.blocks.append(block)
+        return block.name, array.shape, array.dtype.str
+
+    @staticmethod
+    def attach(spec):
+        """
+        Build a FaceMatcher over the shared arrays (no copy)
+
+        Returns:
+            (matcher, blocks): keep the blocks referenced while the matcher is in use
+        """
+        blocks, arrays = [], {}
+        for key in ('matrix', 'labels', 'sq_norms', 'scales'):
+            if key not in spec:
+                continue
+            name, shape, dtype = spec[key]
+            block = shared_memory.SharedMemory(name=name)
+            blocks.append(block)
+            arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        matcher = FaceMatcher.from_arrays(arrays['matrix'], arrays['labels'], spec['identities'],
+                                          spec['tolerance'], spec['min_margin'],
+                                          arrays.get('scales'), arrays['sq_norms'])
+        if spec['condense']:
+            # Prototypes are small, so each worker builds its own from the shared gallery
+            matcher.use_prototypes(Prototypes.build(matcher))
+        return matcher, blocks
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def parse_source(source):
+    """Camera indexes are given as numbers; anything else is a file, URL or RTSP stream"""
+    return int(source) if source.isdigit() else source
+
+
+def _send_stats(stats, camera_id, fps, latencies, frames):
+    p50, p95 = np.percentile(latencies, (50, 95)) * 1000
+    try:
+        stats.put_nowait(('stats', camera_id, fps, p50, p95, frames))
+    except queue.Full:
+        pass
+
+
+def camera_worker(camera_id, source, gallery_spec, events, stats, stop, report_interval=5.0,
+                  display=False, scale=0.25, detector=None):
+    """
+    One camera: read frames, recognize faces and send events to the parent
+
+    Recognized names are sent as ('mark', camera_id, name, timestamp) and
+    per-camera FPS/latency as ('stats', camera_id, fps, p50_ms, p95_ms, frames).
+    """
+    matcher, blocks = SharedGallery.attach(gallery_spec)
+    cap = cv2.VideoCapture(parse_source(source))
+    if not cap.isOpened():
+        events.put(('error', camera_id, f"Could not open camera source {source}"))
+        del matcher
+        for block in blocks:
+            block.close()
+        return
+
+    latencies = deque(maxlen=500)
+    frames = 0
+    window_start = time.perf_counter()
+    window_frames = 0
+    recently_sent = {}
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                if os.path.isfile(source):
+                    break  # end of a recorded video
+                time.sleep(0.5)
+                continue
+            start = time.perf_counter()
+
+            small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            results = identify_faces(rgb_small_frame, matcher, scale=scale, detector=detector)
+
+            now = time.time()
+            for face_location, match in results:
+                # The parent deduplicates per day; this only avoids flooding the queue
+                if match.name is not None and now - recently_sent.get(match.name, 0) > 5:
+                    recently_sent[match.name] = now
+                    events.put(('mark', camera_id, match.name, now))
+
+            latencies.append(time.perf_counter() - start)
+            frames += 1
+            window_frames += 1
+
+            if display:
+                for (top, right, bottom, left), match in results:
+                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+                    cv2.putText(frame, match.name or "Unknown", (left + 6, bottom - 6),
+                                cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+                cv2.imshow(f"Camera {camera_id}", frame)
+                cv2.waitKey(1)
+
+            elapsed = time.perf_counter() - window_start
+            if elapsed >= report_interval:
+                _send_stats(stats, camera_id, window_frames / elapsed, latencies, frames)
+                window_start = time.perf_counter()
+                window_frames = 0
+
+        elapsed = time.perf_counter() - window_start
+        if window_frames and elapsed > 0:
+            _send_stats(stats, camera_id, window_frames / elapsed, latencies, frames)
+    finally:
+        cap.release()
+        if display:
+            cv2.destroyAllWindows()
+        del matcher
+        for block in blocks:
+            block.close()
+
+
+def run_cameras(system, sources, report_interval=5.0, display=False):
+    """Run one worker process per camera and funnel their events into one attendance writer"""
+    gallery = SharedGallery(system.matcher)
+    events = mp.Queue()
+    stats = mp.Queue(maxsize=100)
+    stop = mp.Event()
+
+    workers = []
+    for camera_id, source in enumerate(sources):
+        worker = mp.Process(target=camera_worker, name=f'camera-{camera_id}',
+                            args=(camera_id, source, gallery.spec, events, stats, stop,
+                                  report_interval, display, 0.25, system.detector))
+        worker.start()
+        workers.append(worker)
+    print(f"Started {len(workers)} camera workers sharing a {len(system.matcher)}-encoding gallery")
+
+    try:
+        while True:
+            running = any(w.is_alive() for w in workers)
+            try:
+                event = events.get(timeout=0.2)
+            except queue.Empty:
+                event = None
+                if not running:
+                    break
+            if event and event[0] == 'mark':
+                _, camera_id, name, _ = event
+                if system.mark_attendance(name):
+                    print(f"  (camera {camera_id}: {sources[camera_id]})")
+            elif event and event[0] == 'error':
+                print(f"Camera {event[1]}: {event[2]}")
+
+            while True:
+                try:
+                    _, camera_id, fps, p50, p95, frames = stats.get_nowait()
+                except queue.Empty:
+                    break
+                print(f"Camera {camera_id} ({sources[camera_id]}): {fps:.1f} FPS, "
+                      f"latency p50 {p50:.0f} ms / p95 {p95:.0f} ms, {frames} frames")
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        gallery.close()
+        system.attendance_store.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run attendance recognition on several cameras at once")
+    parser.add_argument('sources', nargs='+', help="camera indexes, video files or stream URLs")
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                        help="seconds between per-camera FPS/latency reports")
+    parser.add_argument('--display', action='store_true', help="show a window per camera")
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    args = parser.parse_args()
+
+    print("=== Face Recognition Attendance System (multi-camera) ===\n")
+    system = AttendanceSystem(tolerance=args.tolerance)
+    run_cameras(system, args.sources, args.report_interval, args.display)
@@ -0,0 +1,128 @@
+import argparse
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+
+WHITE = (255, 255, 255)
+DASHBOARD_HEIGHT = 100
+DASHBOARD_COLOR = (50, 50, 50)
+DASHBOARD_ALPHA = 0.7
+LABEL_HEIGHT = 35
+LABEL_COLOR = (0, 255, 0)
+LABEL_ALPHA = 0.7
+
+
+class OverlayRenderer:
+    """
+    Dashboard and face-label drawing without full-frame copies
+
+    Semi-transparent areas are blended in place on their region of interest
+    only, against colour planes that are allocated once and reused. Text is
+    drawn with cv2.putText directly; it only touches the glyph pixels, so
+    it was never the expensive part.
+    """
+
+    def __init__(self):
+        self.planes = {}
+
+    def _plane(self, color, height, width):
+        """A reusable (height, width, 3) block of a solid colour"""
+        plane = self.planes.get(color)
+        if plane is None or plane.shape[0] < height or plane.shape[1] < width:
+            shape = (max(height, plane.shape[0] if plane is not None else 0),
+                     max(width, plane.shape[1] if plane is not None else 0), 3)
+            plane = np.empty(shape, dtype=np.uint8)
+            plane[:] = color
+            self.planes[color] = plane
+        return plane[:height, :width]
+
+    def blend_rect(self, frame, top, left, bottom, right, color, alpha):
+        """Alpha-blend a solid rectangle into the frame in place (clipped to the frame)"""
+        height, width = frame.shape[:2]
+        top, bottom = max(0, top), min(height, bottom)
+        left, right = max(0, left), min(width, right)
+        if bottom <= top or right <= left:
+            return
+        roi = frame[top:bottom, left:right]
+        if len(set(color)) == 1:
+            # Grey: a single scale-and-offset pass, no colour plane needed
+            cv2.convertScaleAbs(roi, dst=roi, alpha=1 - alpha, beta=alpha * color[0])
+        else:
+            cv2.addWeighted(roi, 1 - alpha, self._plane(color, bottom - top, right - left),
+                            alpha, 0, dst=roi)
+
+    def draw_dashboard(self, frame, info_text, status_text):
+        """Dashboard bar: blended background with the title, info, status and controls lines"""
+        width = frame.shape[1]
+        # cv2.rectangle bounds are inclusive, so the bar covers rows 0..DASHBOARD_HEIGHT
+        self.blend_rect(frame, 0, 0, DASHBOARD_HEIGHT + 1, width, DASHBOARD_COLOR, DASHBOARD_ALPHA)
+        cv2.putText(frame, "Face Recognition Attendance System", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, WHITE, 2)
+        cv2.putText(frame, info_text, (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.6, WHITE, 1)
+        cv2.putText(frame, status_text, (width - 400, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, WHITE, 1)
+        cv2.putText(frame, "Controls: Q - Quit | R - Reset Daily Attendance", (width - 400, 70),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, WHITE, 1)
+
+    def draw_face_box(self, frame, face_location, name):
+        """Face box with a blended name label along its bottom edge"""
+        top, right, bottom, left = (int(v) for v in face_location)
+        cv2.rectangle(frame, (left, top), (right, bottom), LABEL_COLOR, 2)
+        self.blend_rect(frame, bottom - LABEL_HEIGHT, left, bottom + 1, right + 1, LABEL_COLOR, LABEL_ALPHA)
+        cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, WHITE, 1)
+
+
+def legacy_render(frame, boxes):
+    """The previous full-frame-copy drawing, kept as the benchmark baseline"""
+    height, width = frame.shape[:2]
+    overlay = frame.copy()
+    cv2.rectangle(overlay, (0, 0), (width, DASHBOARD_HEIGHT), DASHBOARD_COLOR, -1)
+    cv2.addWeighted(overlay, 0.7, frame, 0.3, 0, frame)
+    cv2.putText(frame, "Face Recognition Attendance System", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, WHITE, 2)
+    cv2.putText(frame, datetime.now().strftime("Date: %Y-%m-%d | Time: %H:%M:%S"), (10, 70),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, WHITE, 1)
+    cv2.putText(frame, "FPS: 30.0 | Registered: 100 | Present Today: 10", (width - 400, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, WHITE, 1)
+    cv2.putText(frame, "Controls: Q - Quit | R - Reset Daily Attendance", (width - 400, 70),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, WHITE, 1)
+    for top, right, bottom, left in boxes:
+        cv2.rectangle(frame, (left, top), (right, bottom), LABEL_COLOR, 2)
+        label_bg = frame.copy()
+        cv2.rectangle(label_bg, (left, bottom - LABEL_HEIGHT), (right, bottom), LABEL_COLOR, -1)
+        cv2.addWeighted(label_bg, 0.7, frame, 0.3, 0, frame)
+        cv2.putText(frame, "person", (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, WHITE, 1)
+
+
+def renderer_render(renderer, frame, boxes):
+    renderer.draw_dashboard(frame, datetime.now().strftime("Date: %Y-%m-%d | Time: %H:%M:%S"),
+                            "FPS: 30.0 | Registered: 100 | Present Today: 10")
+    for box in boxes:
+        renderer.draw_face_box(frame, box, "person")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-frame drawing cost: full-frame copies vs in-place ROI blending")
+    parser.add_argument('--faces', type=int, nargs='+', default=[0, 1, 4, 8])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    renderer = OverlayRenderer()
+    for label, (width, height) in (('480p', (640, 480)), ('720p', (1280, 720)), ('1080p', (1920, 1080))):
+        frame = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+        for faces in args.faces:
+            size = min(width, height) // 5
+            cols = max(1, width // (size + 10))
+            boxes = [(110 + (i // cols) * (size + 10), 10 + (i % cols) * (size + 10) + size,
+                      110 + (i // cols) * (size + 10) + size, 10 + (i % cols) * (size + 10))
+                     for i in range(faces)]
+            timings = []
+            for render in (lambda f: legacy_render(f, boxes), lambda f: renderer_render(renderer, f, boxes)):
+                render(frame.copy())
+                samples = []
+                for _ in range(args.repeat):
+                    target = frame.copy()
+                    start = time.perf_counter()
+                    render(target)
+                    samples.append(time.perf_counter() - start)
+                timings.append(1000 * float(np.median(samples)))
+            print(f"{label:6s} {faces} faces: legacy {timings[0]:7.3f} ms/frame, "
+                  f"in-place {timings[1]:7.3f} ms/frame ({timings[0] / timings[1]:.1f}x)")
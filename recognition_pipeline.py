@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+
+class LatestFrameCapture:
+    """Reads the camera on its own thread and keeps only the newest frame"""
+
+    def __init__(self, cap, on_frame=None):
+        self.cap = cap
+        self.on_frame = on_frame
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_id = 0
+        self.timestamp = 0.0
+        self.running = False
+        self.finished = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name='capture', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def _loop(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                # A replayed session (session_replay.ReplayCapture) has ended
+                if getattr(self.cap, 'finished', False):
+                    with self.condition:
+                        self.finished = True
+                        self.condition.notify_all()
+                    return
+                print("Error: Could not read frame, retrying...")
+                time.sleep(0.5)
+                continue
+
+            timestamp = time.perf_counter()
+            with self.condition:
+                self.frame_id += 1
+                self.frame = frame
+                self.timestamp = timestamp
+                frame_id = self.frame_id
+                self.condition.notify_all()
+
+            if self.on_frame:
+                self.on_frame(frame_id, timestamp, frame)
+
+    def latest(self, after_id=0, timeout=1.0):
+        """Wait for a frame newer than after_id; returns (frame_id, timestamp, frame) or None"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.frame_id > after_id or self.finished, timeout) \
+                    or self.frame_id <= after_id:
+                return None
+            return self.frame_id, self.timestamp, self.frame
+
+
+class RecognitionPipeline:
+    """
+    Capture, recognition and rendering running as separate stages
+
+    A capture thread always holds the newest camera frame. Frames are offered
+    to the recognition workers through a bounded queue that drops the oldest
+    frame when full, so workers only ever see recent frames. The render loop
+    shows every captured frame with the most recent recognition results
+    drawn on top, so display FPS is no longer limited by recognition.
+    """
+
+    def __init__(self, system, cap, workers=1, queue_size=1, latency_window=300):
+        self.system = system
+        self.capture = LatestFrameCapture(cap, on_frame=self._submit)
+        self.workers = max(1, workers)
+        self.frames = queue.Queue(maxsize=max(1, queue_size))
+        self.lock = threading.Lock()
+        self.results = []
+        self.result_frame_id = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.captured = 0
+        self.recognized = 0
+        self.dropped = 0
+        self.running = False
+        # Optional hooks used by session replays: on_capture(frame_id) and
+        # on_result(frame_id, latency, results)
+        self.on_capture = None
+        self.on_result = None
+
+    def _submit(self, frame_id, timestamp, frame):
+        """Queue a frame for recognition, dropping the oldest waiting frame if the queue is full"""
+        self.captured += 1
+        if self.on_capture:
+            self.on_capture(frame_id)
+        # Capture frames are never drawn on (rendering uses a copy), so no copy is needed
+        if self.system.evidence is not None:
+            self.system.evidence.add(frame)
+        item = (frame_id, timestamp, frame)
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                    self.system.metrics.count('dropped_frames')
+                except queue.Empty:
+                    pass
+
+    def _work(self):
+        while self.running:
+            try:
+                frame_id, timestamp, frame = self.frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            try:
+                results = self.system.recognize(frame)
+            except Exception as e:
+                print(f"Error recognizing frame {frame_id}: {str(e)}")
+                continue
+
+            latency = time.perf_counter() - timestamp
+            self.system.metrics.observe('end_to_end', latency)
+            if self.on_result:
+                self.on_result(frame_id, latency, results)
+            with self.lock:
+                # With several workers results can finish out of order; keep the newest
+                if frame_id > self.result_frame_id:
+                    self.results = results
+                    self.result_frame_id = frame_id
+                self.latencies.append(latency)
+                self.recognized += 1
+
+    def latency_percentiles(self, percentiles=(50, 95)):
+        """End-to-end latency (capture to recognition result) in milliseconds"""
+        with self.lock:
+            samples = list(self.latencies)
+        if not samples:
+            return None
+        return [1000 * float(v) for v in np.percentile(samples, percentiles)]
+
+    def run(self, window_name):
+        """
+        Run until the user quits or a replayed session ends; renders on the calling thread
+
+        With window_name None nothing is displayed (headless replays).
+        """
+        self.running = True
+        threads = [threading.Thread(target=self._work, name=f'recognition-{i}', daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        self.capture.start()
+
+        last_id = 0
+        try:
+            while True:
+                latest = self.capture.latest(last_id)
+                if latest is None:
+                    if self.capture.finished:
+                        # Let the workers finish the frames they already have
+                        while not self.frames.empty():
+                            time.sleep(0.01)
+                        break
+                    if window_name and not self.system.handle_key(cv2.waitKey(1) & 0xFF):
+                        break
+                    continue
+
+                last_id, _, frame = latest
+                if not window_name:
+                    continue
+                # Workers may still be reading this frame, so draw on a copy
+                display = frame.copy()
+                with self.lock:
+                    results = self.results
+                    latency = self.latencies[-1] if self.latencies else None
+                self.system.latency_ms = None if latency is None else 1000 * latency
+
+                self.system.render(display, results)
+                cv2.imshow(window_name, display)
+                self.system.frame_shown()
+
+                if not self.system.handle_key(cv2.waitKey(1) & 0xFF):
+                    break
+        finally:
+            self.running = False
+            self.capture.stop()
+            for thread in threads:
+                thread.join(timeout=5)
+            self.report()
+
+    def report(self):
+        print(f"\nPipeline: {self.captured} frames captured, {self.recognized} recognized, "
+              f"{self.dropped} dropped before recognition")
+        percentiles = self.latency_percentiles()
+        if percentiles:
+            print(f"End-to-end latency: p50 {percentiles[0]:.0f} ms, p95 {percentiles[1]:.0f} ms")
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import cv2
+import numpy as np
+import face_recognition
+
+from attendance_system import AttendanceSystem
+from adaptive_scale import to_frame_location
+
+MAX_BODY = 16 * 1024 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+_worker_matcher = None
+_worker_detector = None
+
+
+def _init_worker(matcher, detector):
+    global _worker_matcher, _worker_detector
+    _worker_matcher = matcher
+    _worker_detector = detector
+
+
+def recognize_batch(jpegs, scale=0.25):
+    """
+    Worker: decode, detect and encode a batch of JPEG frames, then match all their faces at once
+
+    Returns:
+        One entry per frame: a list of face dicts, or an error string for an undecodable frame
+    """
+    frames, locations, encodings = [], [], []
+    for jpeg in jpegs:
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            frames.append("could not decode JPEG")
+            continue
+        small = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1 else frame
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        found = _worker_detector.detect(rgb)
+        frames.append(len(found))
+        locations.extend(to_frame_location(location, scale) for location in found)
+        encodings.extend(face_recognition.face_encodings(rgb, found))
+
+    # One matcher call for every face in the batch
+    matches = iter(_worker_matcher.match(encodings))
+    boxes = iter(locations)
+    results = []
+    for entry in frames:
+        if isinstance(entry, str):
+            results.append(entry)
+            continue
+        faces = []
+        for _ in range(entry):
+            match = next(matches)
+            faces.append({'box': list(next(boxes)),
+                          'name': match.name or "Unknown",
+                          'distance': round(match.distance, 4) if match.distance != float('inf') else None})
+        results.append(faces)
+    return results
+
+
+class RecognitionService:
+    """
+    Asyncio HTTP front end that micro-batches frames into a recognition process pool
+
+    POST /recognize with a JPEG body returns the faces found in it. Requests
+    wait in a bounded queue; a batcher takes up to batch_size of them as soon
+    as a worker is free (waiting at most batch_wait seconds to fill a batch),
+    so batches grow with load and shrink to one frame when the service is
+    idle. A full queue is answered with 503 straight away, and a request
+    whose deadline passes while it waits is dropped and answered with 504.
+    """
+
+    def __init__(self, system, workers=1, batch_size=8, batch_wait=0.005, queue_size=64,
+                 deadline=2.0, scale=0.25):
+        self.system = system
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.scale = scale
+        self.executor = None
+        self.queue = None
+        self.slots = None
+
+    async def run(self, host='127.0.0.1', port=8080):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.slots = asyncio.Semaphore(self.workers)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.system.matcher, self.system.detector))
+        server = await asyncio.start_server(self.handle, host, port)
+        batcher = asyncio.create_task(self.batch_loop())
+        print(f"Recognition service listening on http://{host}:{port}/recognize "
+              f"({self.workers} workers, batches of up to {self.batch_size})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.system.attendance_store.flush()
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            wait_until = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), max(0, wait_until - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+
+            # Skip requests that already gave up
+            now = loop.time()
+            batch = [item for item in batch if item[1] > now and not item[2].done()]
+            self.system.metrics.gauge('service_queue_depth', self.queue.qsize())
+            if not batch:
+                self.slots.release()
+                continue
+            self.system.metrics.count('service_batches')
+            self.system.metrics.count('service_frames', len(batch))
+            asyncio.create_task(self.dispatch(batch))
+
+    async def dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, recognize_batch,
+                                                 [jpeg for jpeg, _, _ in batch], self.scale)
+        except Exception as e:
+            print(f"Error recognizing batch of {len(batch)} frames: {str(e)}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def recognize(self, jpeg, deadline, mark):
+        """(status, payload) for one frame"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        expires = start + deadline
+        future = loop.create_future()
+        try:
+            self.queue.put_nowait((jpeg, expires, future))
+        except asyncio.QueueFull:
+            self.system.metrics.count('service_rejected')
+            return 503, {'error': 'busy, try again later'}
+
+        try:
+            result = await asyncio.wait_for(future, deadline)
+        except asyncio.TimeoutError:
+            self.system.metrics.count('service_timeouts')
+            return 504, {'error': f'deadline of {1000 * deadline:.0f} ms exceeded'}
+        except Exception as e:
+            return 500, {'error': str(e)}
+        if isinstance(result, str):
+            return 400, {'error': result}
+
+        if mark:
+            for face in result:
+                if face['name'] != "Unknown" and self.system.mark_attendance(face['name']):
+                    face['marked'] = True
+        elapsed = loop.time() - start
+        self.system.metrics.observe('service_request', elapsed)
+        return 200, {'faces': result, 'latency_ms': round(1000 * elapsed, 2)}
+
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if url.path == '/recognize':
+            if method != 'POST':
+                return 405, {'error': 'POST a JPEG frame'}
+            if not body:
+                return 400, {'error': 'empty body'}
+            try:
+                deadline = float(query.get('deadline_ms', [headers.get('x-deadline-ms', '')])[0]) / 1000
+            except ValueError:
+                deadline = self.deadline
+            mark = query.get('mark', ['1'])[0] not in ('0', 'false')
+            return await self.recognize(body, deadline if deadline > 0 else self.deadline, mark)
+        if url.path == '/health':
+            return 200, {'status': 'ok', 'queue': self.queue.qsize(), 'workers': self.workers,
+                         'gallery': len(self.system.matcher)}
+        if url.path == '/metrics':
+            return 200, self.system.metrics.prometheus()
+        return 404, {'error': 'not found'}
+
+    async def handle(self, reader, writer):
+        """One HTTP/1.1 connection; keep-alive so clients can stream frames"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'bad request line'}, close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {'error': 'bad content-length'}, close=True)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': 'frame too large'}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+                status, payload = await self.route(method, target, headers, body)
+                await self.respond(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, close=False):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}"]
+        if status == 503:
+            head.append("Retry-After: 1")
+        if close:
+            head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP recognition service: POST JPEG frames to /recognize")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1, help="recognition processes (0 = one per CPU core)")
+    parser.add_argument('--batch-size', type=int, default=8, help="most frames sent to a worker at once")
+    parser.add_argument('--batch-wait', type=float, default=5.0,
+                        help="ms to wait for more frames before sending a partial batch")
+    parser.add_argument('--queue-size', type=int, default=64,
+                        help="frames that may wait before new requests get 503")
+    parser.add_argument('--deadline', type=float, default=2000.0,
+                        help="default per-request deadline in ms (clients can send X-Deadline-Ms)")
+    parser.add_argument('--detect-scale', type=float, default=0.25,
+                        help="resize frames by this factor before detection")
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    system = AttendanceSystem(workers=workers, tolerance=args.tolerance)
+    service = RecognitionService(system, workers, args.batch_size, args.batch_wait / 1000,
+                                 args.queue_size, args.deadline / 1000, args.detect_scale)
+    try:
+        asyncio.run(service.run(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nRecognition service stopped")
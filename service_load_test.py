@@ -0,0 +1,107 @@
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from collections import Counter
+import cv2
+import numpy as np
+
+
+def load_frames(paths, limit=32):
+    """JPEG bytes for up to `limit` images, or a synthetic frame when none are given"""
+    frames = []
+    for path in paths[:limit]:
+        with open(path, 'rb') as f:
+            frames.append(f.read())
+    if not frames:
+        frame = np.random.default_rng(0).integers(40, 90, (480, 640, 3), dtype=np.uint8)
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    return frames
+
+
+def client(host, port, frames, deadline_ms, stop_at, remaining, results, lock):
+    """One keep-alive connection sending frames back to back until time or requests run out"""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {'Content-Type': 'image/jpeg', 'X-Deadline-Ms': str(deadline_ms)}
+    i = 0
+    while time.perf_counter() < stop_at:
+        with lock:
+            if remaining[0] <= 0:
+                break
+            remaining[0] -= 1
+        body = frames[i % len(frames)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('POST', '/recognize?mark=0', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = 'error'
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+        results.append((status, time.perf_counter() - start))
+    conn.close()
+
+
+def run_load(host, port, frames, concurrency, requests, duration, deadline_ms):
+    results = []
+    lock = threading.Lock()
+    remaining = [requests or float('inf')]
+    start = time.perf_counter()
+    stop_at = start + duration if duration else float('inf')
+    threads = [threading.Thread(target=client, args=(host, port, frames, deadline_ms, stop_at,
+                                                     remaining, results, lock), daemon=True)
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(str(status) for status, _ in results)
+    ok = np.array([latency for status, latency in results if status == 200]) * 1000
+    report = {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed > 0 else None,
+        'statuses': dict(statuses),
+    }
+    if len(ok):
+        report.update({f'p{q}_ms': round(float(np.percentile(ok, q)), 2) for q in (50, 95, 99)})
+        report['max_ms'] = round(float(ok.max()), 2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for recognition_service.py")
+    parser.add_argument('images', nargs='*', help="JPEG frames to send (default: a synthetic frame)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help="simultaneous clients; several values run one after another")
+    parser.add_argument('--requests', type=int, default=None, help="requests per run")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per run (if --requests is not set)")
+    parser.add_argument('--deadline', type=int, default=2000, help="per-request deadline in ms")
+    parser.add_argument('--output', default=None, help="also write the reports to this JSON file")
+    args = parser.parse_args()
+
+    images = [p for p in args.images if os.path.isfile(p)]
+    frames = load_frames(images)
+    reports = []
+    for concurrency in args.concurrency:
+        report = run_load(args.host, args.port, frames, concurrency, args.requests,
+                          None if args.requests else args.duration, args.deadline)
+        reports.append(report)
+        latency = (f"p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms, "
+                   f"p99 {report['p99_ms']:.1f} ms" if 'p50_ms' in report else "no successful requests")
+        print(f"{concurrency:3d} clients: {report['throughput_rps']} frames/sec, {latency}, "
+              f"statuses {report['statuses']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"Wrote {args.output}")
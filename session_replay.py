@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import queue
+import struct
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+
+MAGIC = b'FRSESSION1\n'
+RECORD = struct.Struct('<dI')  # seconds since the start of the recording, JPEG length
+
+
+class SessionWriter:
+    """
+    Appends camera frames to a session file: a JSON header, then (timestamp, JPEG) records
+
+    Frames are JPEG-encoded on a background thread; if the encoder falls
+    behind, frames are dropped (and counted) rather than stalling the camera.
+    The file only depends on the JPEG bytes, so every replay decodes exactly
+    the same pixels.
+    """
+
+    def __init__(self, path, quality=95, queue_size=32, **header):
+        self.file = open(path, 'wb')
+        header = {'created': datetime.now().isoformat(timespec='seconds'), 'quality': quality, **header}
+        encoded = json.dumps(header).encode()
+        self.file.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        self.quality = quality
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._loop, name='session-writer', daemon=True)
+        self.thread.start()
+
+    def add(self, timestamp, frame):
+        try:
+            self.frames.put_nowait((timestamp, frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def _loop(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            timestamp, frame = item
+            ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                self.file.write(RECORD.pack(timestamp, len(jpeg)) + jpeg.tobytes())
+                self.written += 1
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+def read_session(path):
+    """
+    Read a session file
+
+    Returns:
+        (header, iterator of (timestamp, jpeg_bytes))
+    """
+    f = open(path, 'rb')
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a recorded session")
+    (size,) = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(size))
+
+    def records():
+        with f:
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return
+                timestamp, length = RECORD.unpack(head)
+                jpeg = f.read(length)
+                if len(jpeg) < length:
+                    return  # recording was cut off mid-frame
+                yield timestamp, jpeg
+
+    return header, records()
+
+
+class ReplayCapture:
+    """
+    A cv2.VideoCapture stand-in that plays back a recorded session
+
+    With realtime, read() waits until each frame's original offset from
+    the first frame, so the recognition pipeline sees the same pacing (and
+    drops frames the same way) as with the live camera; otherwise frames
+    are returned as fast as they can be decoded. `finished` is set once
+    the session has been played.
+    """
+
+    def __init__(self, path, realtime=False):
+        self.header, self.records = read_session(path)
+        self.realtime = realtime
+        self.frame_index = -1
+        self.timestamp = None
+        self.finished = False
+        self.started = None
+
+    def isOpened(self):
+        return not self.finished
+
+    def read(self):
+        record = next(self.records, None)
+        if record is None:
+            self.finished = True
+            return False, None
+        timestamp, jpeg = record
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if self.realtime:
+            if self.started is None:
+                self.started = time.perf_counter() - timestamp
+            delay = self.started + timestamp - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.frame_index += 1
+        self.timestamp = timestamp
+        return True, frame
+
+    def release(self):
+        self.finished = True
+
+
+def record_session(path, source=0, seconds=None, quality=95, preview=True):
+    """Record raw frames from a camera (or video file) until Q is pressed or `seconds` have passed"""
+    cap = cv2.VideoCapture(source, cv2.CAP_DSHOW) if isinstance(source, int) else cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"Error: Could not open {source}")
+        return False
+    writer = SessionWriter(path, quality, source=str(source),
+                           width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                           height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    print(f"Recording to {path}" + (f" for {seconds:g}s" if seconds else "") + " (press Q to stop)")
+    start = time.perf_counter()
+    try:
+        while seconds is None or time.perf_counter() - start < seconds:
+            ret, frame = cap.read()
+            if not ret:
+                if not isinstance(source, int):
+                    break
+                time.sleep(0.05)
+                continue
+            # Video files keep their own timing; cameras are stamped as frames arrive
+            timestamp = time.perf_counter() - start if isinstance(source, int) \
+                else cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            writer.add(timestamp, frame)
+            if preview:
+                cv2.imshow('Recording session', frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+    finally:
+        cap.release()
+        if preview:
+            cv2.destroyAllWindows()
+        writer.close()
+    print(f"Recorded {writer.written} frames in {time.perf_counter() - start:.1f}s"
+          + (f" ({writer.dropped} dropped because encoding fell behind)" if writer.dropped else ""))
+    return True
+
+
+def trace_entry(frame_index, timestamp, latency, results):
+    return {'frame': frame_index, 'timestamp': round(timestamp, 6), 'latency_ms': round(1000 * latency, 3),
+            'faces': [{'box': [int(c) for c in box], 'name': name} for box, name in results]}
+
+
+def replay_session(system, path, trace_path, realtime=False, pipeline_workers=0, display=False):
+    """
+    Feed a recorded session through the recognition system and write a per-frame trace
+
+    As fast as possible (the default), every frame is recognized in order on
+    this thread and latency_ms is the recognize() time. With realtime the
+    frames go through the threaded RecognitionPipeline at their original
+    pacing, so frames may be dropped as they would be live, and latency_ms
+    is the end-to-end time from capture to result. The trace is a JSON line
+    per recognized frame followed by a summary line with the stage metrics.
+    """
+    capture = ReplayCapture(path, realtime)
+    start = time.perf_counter()
+    lock = threading.Lock()
+    with open(trace_path, 'w') as trace:
+        def write(frame_index, timestamp, latency, results):
+            line = json.dumps(trace_entry(frame_index, timestamp, latency, results)) + '\n'
+            with lock:  # pipeline workers finish frames concurrently
+                trace.write(line)
+
+        if realtime:
+            # Imported here because recognition_pipeline is only needed for paced replays
+            from recognition_pipeline import RecognitionPipeline
+            timestamps = {}
+            pipeline = RecognitionPipeline(system, capture, max(1, pipeline_workers))
+            pipeline.on_capture = lambda frame_id: timestamps.__setitem__(frame_id, capture.timestamp)
+            pipeline.on_result = lambda frame_id, latency, results: write(
+                frame_id - 1, timestamps.pop(frame_id, 0.0), latency, results)
+            pipeline.run(window_name='Replay' if display else None)
+            frames = pipeline.recognized
+        else:
+            frames = 0
+            while True:
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                frame_start = time.perf_counter()
+                results = system.recognize(frame)
+                write(capture.frame_index, capture.timestamp, time.perf_counter() - frame_start, results)
+                frames += 1
+                if display:
+                    system.render(frame, results)
+                    cv2.imshow('Replay', frame)
+                    if not system.handle_key(cv2.waitKey(1) & 0xFF):
+                        break
+
+        elapsed = time.perf_counter() - start
+        trace.write(json.dumps({'summary': {'frames': frames, 'seconds': round(elapsed, 3),
+                                            'realtime': realtime, 'session': os.path.abspath(path),
+                                            'metrics': system.metrics.snapshot()}}) + '\n')
+    if display:
+        cv2.destroyAllWindows()
+    print(f"Replayed {frames} frames in {elapsed:.1f}s ({frames / elapsed if elapsed > 0 else 0:.1f} frames/sec); "
+          f"trace written to {trace_path}")
+    return frames
+
+
+def load_trace(path):
+    """(frames by index, summary) from a trace file"""
+    frames, summary = {}, {}
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if 'summary' in entry:
+                summary = entry['summary']
+            else:
+                frames[entry['frame']] = entry
+    return frames, summary
+
+
+def latency_stats(frames):
+    latencies = np.array([entry['latency_ms'] for entry in frames.values()])
+    if not len(latencies):
+        return {}
+    return {'p50_ms': float(np.percentile(latencies, 50)), 'p95_ms': float(np.percentile(latencies, 95)),
+            'mean_ms': float(latencies.mean())}
+
+
+def diff_traces(old_path, new_path, threshold=0.10, min_ms=0.5):
+    """
+    Compare two replays of the same session
+
+    Returns:
+        dict with 'changed' frames (different names or face counts), 'latency'
+        rows (old, new, change) and 'regressions': the latency rows slower by
+        more than threshold (and min_ms), plus per-stage regressions
+    """
+    old, old_summary = load_trace(old_path)
+    new, new_summary = load_trace(new_path)
+    common = sorted(old.keys() & new.keys())
+
+    changed = []
+    for index in common:
+        before = sorted(face['name'] for face in old[index]['faces'])
+        after = sorted(face['name'] for face in new[index]['faces'])
+        if before != after:
+            changed.append((index, before, after))
+
+    def compare(label, before, after):
+        change = (after - before) / before if before > 0 else float('inf')
+        return label, before, after, change, after - before >= min_ms and change > threshold
+
+    rows = []
+    old_stats = latency_stats({i: old[i] for i in common})
+    new_stats = latency_stats({i: new[i] for i in common})
+    for key in old_stats:
+        rows.append(compare(f"frame {key[:-3]}", old_stats[key], new_stats[key]))
+    old_stages = old_summary.get('metrics', {}).get('stages', {})
+    new_stages = new_summary.get('metrics', {}).get('stages', {})
+    for stage in sorted(old_stages.keys() & new_stages.keys()):
+        if old_stages[stage].get('p50_ms') is not None and new_stages[stage].get('p50_ms') is not None:
+            rows.append(compare(f"{stage} p50", old_stages[stage]['p50_ms'], new_stages[stage]['p50_ms']))
+
+    return {'frames': len(common), 'only_old': len(old.keys() - new.keys()),
+            'only_new': len(new.keys() - old.keys()), 'changed': changed,
+            'latency': rows, 'regressions': [row for row in rows if row[4]]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record camera sessions and replay them through the "
+                                                 "recognition system to compare accuracy and latency")
+    sub = parser.add_subparsers(dest='command')
+
+    rec = sub.add_parser('record', help="record raw camera frames to a session file")
+    rec.add_argument('session')
+    rec.add_argument('--source', default='0', help="camera index or video file")
+    rec.add_argument('--seconds', type=float, default=None)
+    rec.add_argument('--quality', type=int, default=95, help="JPEG quality of the stored frames")
+    rec.add_argument('--no-preview', action='store_true')
+
+    play = sub.add_parser('replay', help="run a session through recognition and write a trace")
+    play.add_argument('session')
+    play.add_argument('--trace', default=None, help="trace file (default: <session>.<time>.trace.jsonl)")
+    play.add_argument('--realtime', action='store_true',
+                      help="original pacing through the threaded pipeline (default: every frame, "
+                           "as fast as possible)")
+    play.add_argument('--pipeline-workers', type=int, default=1)
+    play.add_argument('--display', action='store_true')
+    play.add_argument('--tolerance', type=float, default=0.6)
+    play.add_argument('--detector', default='hog', choices=['auto', 'hog', 'haar', 'lbp', 'dnn'])
+    play.add_argument('--detect-scale', type=float, default=0.25,
+                      help="fixed detection scale (the adaptive scale depends on timing, so it is "
+                           "only used with --adaptive)")
+    play.add_argument('--adaptive', action='store_true', help="choose the detection scale per frame")
+    play.add_argument('--motion-threshold', type=float, default=0.0,
+                      help="motion gating (off by default: its forced detections follow the wall clock)")
+    play.add_argument('--int8-gallery', action='store_true')
+    play.add_argument('--no-condense', action='store_true')
+
+    diff = sub.add_parser('diff', help="compare two replay traces")
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=0.10, help="relative slowdown that counts as a regression")
+    diff.add_argument('--min-ms', type=float, default=0.5, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        source = int(args.source) if args.source.isdigit() else args.source
+        sys.exit(0 if record_session(args.session, source, args.seconds, args.quality,
+                                     not args.no_preview) else 1)
+
+    elif args.command == 'replay':
+        from attendance_system import AttendanceSystem
+
+        trace_path = args.trace or f"{args.session}.{datetime.now().strftime('%Y%m%d_%H%M%S')}.trace.jsonl"
+        # Replays must not mark real attendance
+        with tempfile.TemporaryDirectory() as scratch:
+            system = AttendanceSystem(tolerance=args.tolerance, detector=args.detector,
+                                      detect_scale=None if args.adaptive else args.detect_scale,
+                                      motion_threshold=args.motion_threshold, quantize=args.int8_gallery,
+                                      condense=not args.no_condense,
+                                      attendance_file=os.path.join(scratch, 'attendance.csv'))
+            try:
+                replay_session(system, args.session, trace_path, args.realtime, args.pipeline_workers,
+                               args.display)
+            finally:
+                system.attendance_store.close()
+
+    elif args.command == 'diff':
+        report = diff_traces(args.old, args.new, args.threshold, args.min_ms)
+        print(f"{report['frames']} frames in both traces"
+              + (f" ({report['only_old']} only in the old, {report['only_new']} only in the new)"
+                 if report['only_old'] or report['only_new'] else ""))
+        print(f"\nRecognition changed on {len(report['changed'])} frames")
+        for index, before, after in report['changed'][:20]:
+            print(f"  frame {index}: {', '.join(before) or '-'} -> {', '.join(after) or '-'}")
+        print("\nLatency (old -> new):")
+        for label, before, after, change, regressed in report['latency']:
+            print(f"  {label:28s} {before:9.3f} -> {after:9.3f} ms  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+        sys.exit(1 if report['changed'] or report['regressions'] else 0)
+
+    else:
+        parser.print_help()
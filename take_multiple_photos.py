@@ -1,12 +1,62 @@
 import cv2
+import hashlib
+import io
 import os
 import sys
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import face_recognition
+
+from gallery_cache import GalleryCache
+
+BLUR_THRESHOLD = 60.0  # variance of the Laplacian of the face, resized to 128x128
+DUPLICATE_DISTANCE = 0.15  # closer than this to an existing photo of the person adds nothing
+
+
+def check_capture(jpeg):
+    """
+    Process pool entry point: detect, blur-check and encode one captured photo
+
+    The JPEG bytes are decoded the same way the attendance system loads
+    photos, so the encoding is the one it would compute itself.
+
+    Returns:
+        (encoding, None) for a usable photo, or (None, reason) if it was rejected
+    """
+    image = face_recognition.load_image_file(io.BytesIO(jpeg))
+    locations = face_recognition.face_locations(image)
+    if not locations:
+        return None, "no face found"
+    if len(locations) > 1:
+        return None, f"{len(locations)} faces in frame"
+
+    top, right, bottom, left = locations[0]
+    face = cv2.cvtColor(image[max(0, top):bottom, max(0, left):right], cv2.COLOR_RGB2GRAY)
+    sharpness = cv2.Laplacian(cv2.resize(face, (128, 128)), cv2.CV_64F).var()
+    if sharpness < BLUR_THRESHOLD:
+        return None, f"too blurry (sharpness {sharpness:.0f})"
+
+    return face_recognition.face_encodings(image, locations)[0], None
+
+
+def next_photo_path(user_dir, index):
+    """First photo_N.jpg at or after index that does not exist yet"""
+    while os.path.exists(os.path.join(user_dir, f"photo_{index}.jpg")):
+        index += 1
+    return os.path.join(user_dir, f"photo_{index}.jpg"), index
+
 
 def take_multiple_photos(name, num_photos=3, delay=2):
     """
     Take multiple photos of the same person to improve recognition accuracy
+
+    Each capture is checked on a background process while the countdown
+    keeps running: photos with no face (or several), too much blur, or an
+    encoding nearly identical to one the person already has are rejected.
+    Accepted photos are saved together with their encoding in the gallery
+    cache, so the attendance system does not need to encode them again.
     
     Args:
         name: Person's name
@@ -41,12 +91,48 @@ def take_multiple_photos(name, num_photos=3, delay=2):
     
     # Wait a moment for the camera to initialize
     time.sleep(1)
+
+    # Encodings this person already has, to reject near-duplicates
+    cache = GalleryCache().load()
+    known_encodings = [entry['encoding'] for entry in cache.entries.values()
+                       if entry['name'] == name and entry['has_face']]
+    executor = ProcessPoolExecutor(max_workers=1)
+    pending = deque()
+    status, status_until = "", 0
+    next_index = 1
     
     photos_taken = 0
     countdown = delay
     last_time = time.time()
     
     while photos_taken < num_photos:
+        # Collect finished checks; save the photos that passed
+        while pending and pending[0].done():
+            future, jpeg = pending.popleft()
+            try:
+                encoding, reason = future.result()
+            except Exception as e:
+                encoding, reason = None, str(e)
+            if encoding is not None and known_encodings and \
+                    min(face_recognition.face_distance(known_encodings, encoding)) < DUPLICATE_DISTANCE:
+                encoding, reason = None, "too similar to an earlier photo"
+            if encoding is None:
+                status = f"Photo rejected: {reason}"
+                print(f"Photo rejected: {reason}")
+            else:
+                filename, next_index = next_photo_path(user_dir, next_index)
+                with open(filename, 'wb') as f:
+                    f.write(jpeg)
+                cache.put(filename, name, encoding, digest=hashlib.sha1(jpeg).hexdigest())
+                cache.save()
+                known_encodings.append(encoding)
+                photos_taken += 1
+                status = f"Photo {photos_taken} accepted"
+                print(f"Photo {photos_taken} saved as {filename}")
+            status_until = time.time() + 2
+        if photos_taken >= num_photos:
+            break
+
         # Capture frame-by-frame
         ret, frame = cap.read()
         if not ret:
@@ -54,11 +140,17 @@ def take_multiple_photos(name, num_photos=3, delay=2):
             time.sleep(0.5)
             continue
         
-        # Calculate countdown
+        # Calculate countdown (paused while enough photos are already being checked)
         current_time = time.time()
         if current_time - last_time >= 1:
             countdown -= 1
             last_time = current_time
+        waiting = photos_taken + len(pending) >= num_photos
+        if waiting:
+            countdown = max(countdown, 1)
+
+        # Keep the raw frame before the instructions are drawn onto it
+        capture = frame.copy() if countdown <= 0 else None
         
         # Add instructions and countdown to the frame
         # Create a semi-transparent overlay for text
@@ -71,26 +163,29 @@ def take_multiple_photos(name, num_photos=3, delay=2):
         cv2.putText(frame, info_text, (10, 30),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         
-        countdown_text = f"Next photo in: {countdown} seconds" if countdown > 0 else "CAPTURING..."
+        if waiting:
+            countdown_text = "Checking photo..."
+        else:
+            countdown_text = f"Next photo in: {countdown} seconds" if countdown > 0 else "CAPTURING..."
         cv2.putText(frame, countdown_text, (10, 70),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         
-        cv2.putText(frame, "Press Q to quit", (10, 110),
+        cv2.putText(frame, status if current_time < status_until else "Press Q to quit", (10, 110),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         
         # Display the frame
         cv2.imshow('Take Multiple Photos', frame)
         
         # Take photo when countdown reaches 0
-        if countdown <= 0:
-            # Save the image to the user's directory
-            filename = os.path.join(user_dir, f"photo_{photos_taken+1}.jpg")
-            cv2.imwrite(filename, frame)
-            print(f"Photo {photos_taken+1} saved as {filename}")
+        if capture is not None:
+            # Send the photo to the background check; it is saved once it passes
+            ok, jpeg = cv2.imencode('.jpg', capture)
+            if ok:
+                jpeg = jpeg.tobytes()
+                pending.append((executor.submit(check_capture, jpeg), jpeg))
             
-            # Reset countdown and increment counter
+            # Reset countdown
             countdown = delay
-            photos_taken += 1
             
             # Flash effect to indicate photo taken
             white_frame = np.ones(frame.shape, dtype=np.uint8) * 255
@@ -106,6 +201,7 @@ def take_multiple_photos(name, num_photos=3, delay=2):
     # Release the camera and close windows
     cap.release()
     cv2.destroyAllWindows()
+    executor.shutdown(wait=False, cancel_futures=True)
     
     print(f"\nTook {photos_taken} photos for {name}")
     print(f"Photos saved in directory: {user_dir}")
@@ -208,6 +304,6 @@ if __name__ == "__main__":
     
     print(f"Taking {num_photos} photos for {name}")
     if take_multiple_photos(name, num_photos):
-        print("\nPhoto capture completed. You can now restart the attendance system to recognize this person.")
+        print("\nPhoto capture completed. A running attendance system will pick up this person automatically.")
     else:
         print("\nPhoto capture failed. Please check your webcam and try again.")
@@ -58,4 +58,4 @@ if __name__ == "__main__":
     
     if name:
         if take_photo(name):
-            print("\nPhoto capture completed. You can now restart the attendance system to recognize this person.")
+            print("\nPhoto capture completed. A running attendance system will pick up this person automatically.")
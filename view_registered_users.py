@@ -1,67 +1,139 @@
 import cv2
+import hashlib
 import os
 import numpy as np
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from attendance_system import scan_face_images
+
+CELL_WIDTH, CELL_HEIGHT = 200, 200
+THUMB_SIZE = (CELL_WIDTH - 20, CELL_HEIGHT - 40)
+PHOTOS_PER_USER = 5  # Limit to 5 photos per user to avoid huge grids
+USERS_PER_PAGE = 4
+
+
+def default_thumbnail_dir(images_dir):
+    """Thumbnails stored next to the images directory (known_faces -> known_faces_thumbs)"""
+    images_dir = os.path.normpath(os.path.abspath(images_dir))
+    parent, base = os.path.split(images_dir)
+    return os.path.join(parent, f"{base}_thumbs")
+
+
+class ThumbnailCache:
+    """
+    Small JPEG copies of the registered photos, keyed on path and mtime
+
+    Each thumbnail is named after a hash of the photo's path and given the
+    photo's mtime, so a thumbnail is valid while the two mtimes agree and is
+    simply overwritten when the photo changes. Misses are decoded at reduced
+    resolution where the JPEG allows it, which is much cheaper than a full
+    decode followed by a resize.
+    """
+
+    def __init__(self, images_dir='known_faces', thumb_dir=None, size=THUMB_SIZE):
+        self.thumb_dir = thumb_dir or default_thumbnail_dir(images_dir)
+        self.size = size
+        os.makedirs(self.thumb_dir, exist_ok=True)
+
+    def _thumb_path(self, path):
+        return os.path.join(self.thumb_dir, hashlib.sha1(os.path.normpath(path).encode()).hexdigest() + '.jpg')
+
+    def get(self, path):
+        """Thumbnail for a photo (BGR, self.size), or None if the photo cannot be read"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        thumb_path = self._thumb_path(path)
+        try:
+            if os.stat(thumb_path).st_mtime_ns == mtime_ns:
+                thumb = cv2.imread(thumb_path)
+                if thumb is not None and thumb.shape[1::-1] == self.size:
+                    return thumb
+        except OSError:
+            pass
+
+        img = self._decode(path)
+        if img is None:
+            return None
+        thumb = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        try:
+            cv2.imwrite(thumb_path, thumb, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            os.utime(thumb_path, ns=(mtime_ns, mtime_ns))
+        except (OSError, cv2.error) as e:
+            print(f"Error caching thumbnail for {path}: {str(e)}")
+        return thumb
+
+    def _decode(self, path):
+        """Decode at the smallest JPEG reduction that still covers the thumbnail size"""
+        for flag in (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_COLOR_2):
+            img = cv2.imread(path, flag)
+            if img is None:
+                return None
+            if img.shape[1] >= self.size[0] and img.shape[0] >= self.size[1]:
+                return img
+        return cv2.imread(path)
+
+
+def render_page(users, user_photos, cache, executor, page, users_per_page=USERS_PER_PAGE):
+    """Build the mosaic for one page, decoding only that page's thumbnails in parallel"""
+    page_users = users[page * users_per_page:(page + 1) * users_per_page]
+    grid_cols = min(PHOTOS_PER_USER, max(len(user_photos[u]) for u in page_users))
+
+    # Create a blank canvas for the grid
+    grid = np.full((len(page_users) * CELL_HEIGHT, max(1, grid_cols) * CELL_WIDTH, 3), 255, dtype=np.uint8)
+
+    cells = [(row, col, photo_path) for row, user in enumerate(page_users)
+             for col, photo_path in enumerate(user_photos[user][:grid_cols])]
+    for (row, col, photo_path), thumb in zip(cells, executor.map(lambda c: cache.get(c[2]), cells)):
+        if thumb is None:
+            print(f"Error displaying {photo_path}")
+            continue
+        x = col * CELL_WIDTH + 10
+        y = row * CELL_HEIGHT + 40
+        grid[y:y + thumb.shape[0], x:x + thumb.shape[1]] = thumb
+
+    # Add user name at the beginning of each row
+    for row, user in enumerate(page_users):
+        cv2.putText(grid, user, (10, row * CELL_HEIGHT + 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+    return grid
+
 
 def view_registered_users(auto_view=True):
     """
     Display all registered users and their photos
-    
+
     Args:
         auto_view: If True, automatically view photos without asking
     """
     print("=== Registered Users ===")
-    
+
     # Path to known faces directory
     known_faces_dir = 'known_faces'
-    
+
     if not os.path.exists(known_faces_dir):
         print(f"Error: {known_faces_dir} directory not found!")
         return
-    
-    # Get all users (both from directories and individual photos)
-    users = set()
-    user_photos = {}
-    
-    # First, check for files directly in the known_faces directory
-    for filename in os.listdir(known_faces_dir):
-        file_path = os.path.join(known_faces_dir, filename)
-        if os.path.isfile(file_path) and filename.endswith((".jpg", ".jpeg", ".png")):
-            # Extract name from filename
-            name = os.path.splitext(filename)[0]
-            if '_' in name and name.split('_')[-1].isdigit():
-                # For files like "john_1.jpg", extract just "john"
-                name = '_'.join(name.split('_')[:-1])
-            
-            users.add(name)
-            if name not in user_photos:
-                user_photos[name] = []
-            user_photos[name].append(file_path)
-    
-    # Then, check for user directories
-    for dirname in os.listdir(known_faces_dir):
-        dir_path = os.path.join(known_faces_dir, dirname)
-        if os.path.isdir(dir_path):
-            users.add(dirname)
-            if dirname not in user_photos:
-                user_photos[dirname] = []
-            
-            # Add all photos from this user's directory
-            for filename in os.listdir(dir_path):
-                if filename.endswith((".jpg", ".jpeg", ".png")):
-                    image_path = os.path.join(dir_path, filename)
-                    user_photos[dirname].append(image_path)
-    
+
+    # Get all users (both from directories and individual photos) in one directory pass
+    images, user_dirs = scan_face_images(known_faces_dir)
+    user_photos = {name: [] for name in user_dirs}
+    for image_path, name in images:
+        user_photos.setdefault(name, []).append(image_path)
+    users = sorted(user_photos)
+
     # Display results
     if not users:
         print("No registered users found!")
         return
-    
+
     print(f"Found {len(users)} registered users:")
-    for i, user in enumerate(sorted(users)):
+    for i, user in enumerate(users):
         photo_count = len(user_photos[user])
         print(f"{i+1}. {user} ({photo_count} photos)")
-    
+
     # Ask if user wants to view the photos (if not auto_view)
     view_photos = 'y'
     if not auto_view:
@@ -70,54 +142,34 @@ def view_registered_users(auto_view=True):
         except EOFError:
             print("\nAutomatic mode: showing photos...")
             view_photos = 'y'
-    
+
     if view_photos != 'y':
         return
-    
-    # Create a grid of photos for all users
-    grid_rows = len(users)
-    grid_cols = max(len(photos) for photos in user_photos.values())
-    
-    if grid_cols > 5:  # Limit to 5 photos per user to avoid huge grids
-        grid_cols = 5
-    
-    # Create a blank canvas for the grid
-    cell_height, cell_width = 200, 200
-    grid = np.ones((grid_rows * cell_height, grid_cols * cell_width, 3), dtype=np.uint8) * 255
-    
-    # Fill the grid with photos
-    for row, user in enumerate(sorted(users)):
-        photos = user_photos[user][:grid_cols]  # Limit to grid_cols photos
-        
-        # Add user name at the beginning of the row
-        y_pos = row * cell_height + 30
-        cv2.putText(grid, user, (10, y_pos), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
-        
-        for col, photo_path in enumerate(photos):
-            try:
-                img = cv2.imread(photo_path)
-                if img is None:
-                    continue
-                
-                # Resize to fit cell
-                img = cv2.resize(img, (cell_width - 20, cell_height - 40))
-                
-                # Calculate position
-                x = col * cell_width + 10
-                y = row * cell_height + 40
-                
-                # Place in grid
-                grid[y:y+img.shape[0], x:x+img.shape[1]] = img
-            except Exception as e:
-                print(f"Error displaying {photo_path}: {str(e)}")
-    
-    # Show the grid
+
+    # Show one page of users at a time; only the visible page is decoded
+    cache = ThumbnailCache(known_faces_dir)
+    pages = (len(users) + USERS_PER_PAGE - 1) // USERS_PER_PAGE
+    page = 0
     window_name = "Registered Users"
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-    cv2.imshow(window_name, grid)
-    print("\nShowing all registered users. Press any key to close.")
-    cv2.waitKey(0)
+    if pages > 1:
+        print("\nShowing registered users. N / Space - next page | P - previous page | Q / Esc - close")
+    else:
+        print("\nShowing all registered users. Press any key to close.")
+
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        while True:
+            grid = render_page(users, user_photos, cache, executor, page)
+            cv2.setWindowTitle(window_name, f"Registered Users - page {page + 1}/{pages}")
+            cv2.imshow(window_name, grid)
+
+            key = cv2.waitKey(0) & 0xFF
+            if pages == 1 or key in (ord('q'), 27):
+                break
+            if key in (ord('n'), ord(' '), 83):
+                page = (page + 1) % pages
+            elif key in (ord('p'), 81):
+                page = (page - 1) % pages
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -125,5 +177,5 @@ if __name__ == "__main__":
     auto_view = True
     if len(sys.argv) > 1 and sys.argv[1].lower() == 'manual':
         auto_view = False
-    
+
     view_registered_users(auto_view)